@@ -0,0 +1,76 @@
+import time
+import random
+from collections import namedtuple
+from functools import lru_cache
+
+Arn = namedtuple('Arn', ['partition', 'service', 'region', 'account', 'resource_type', 'resource_id'])
+
+# Services whose resource part nests a parent path before the backed-up resource,
+# e.g. gateway/sgw-1/volume/vol-1 or database/db/table/tbl; the last type/id pair is kept
+NESTED_RESOURCE_SERVICES = {'storagegateway', 'timestream'}
+
+@lru_cache(maxsize=65536)
+def parse_arn(arn):
+    # Parse any ARN AWS Backup reports (EC2, EBS, RDS, Aurora, DocumentDB, Neptune, EFS,
+    # DynamoDB, FSx, S3, Storage Gateway, Redshift, Timestream, CloudFormation, VMware, SAP HANA).
+    # Memoized: a month of jobs holds far fewer distinct ARNs than rows.
+    if not arn:
+        return Arn('', '', '', '', '', '')
+    parts = arn.split(':', 5)
+    if len(parts) != 6 or parts[0] != 'arn':
+        return Arn('', '', '', '', '', arn)
+    _, partition, service, region, account, resource = parts
+
+    if service == 's3' and '/' not in resource:
+        return Arn(partition, service, region, account, 'bucket', resource)
+    if service in NESTED_RESOURCE_SERVICES and resource.count('/') >= 3:
+        resource_type, resource_id = resource.split('/')[-2:]
+        return Arn(partition, service, region, account, resource_type, resource_id)
+
+    # The resource type ends at the first '/' (instance/i-1, table/T, file-system/fs-1)
+    # or ':' (db:name, cluster:name), whichever comes first
+    slash = resource.find('/')
+    colon = resource.find(':')
+    separators = [index for index in (slash, colon) if index != -1]
+    if not separators:
+        return Arn(partition, service, region, account, '', resource)
+    split_at = min(separators)
+    return Arn(partition, service, region, account, resource[:split_at], resource[split_at + 1:])
+
+def resource_id_from_arn(arn):
+    return parse_arn(arn).resource_id
+
+if __name__ == "__main__":
+    # For testing locally: benchmark against the split-based helpers on 1M rows
+    def extract_instance_id(resource_id):
+        parts = resource_id.split('/')
+        return parts[-1] if len(parts) == 2 else ''
+
+    def cloudtrail_resource_id(resource_arn):
+        return resource_arn.split(':')[-1]
+
+    templates = [
+        'arn:aws:ec2:eu-west-1:123456789012:instance/i-{:017x}',
+        'arn:aws:ec2:eu-west-1:123456789012:volume/vol-{:017x}',
+        'arn:aws:rds:eu-west-1:123456789012:db:database-{}',
+        'arn:aws:rds:eu-west-1:123456789012:cluster:aurora-{}',
+        'arn:aws:elasticfilesystem:eu-west-1:123456789012:file-system/fs-{:08x}',
+        'arn:aws:dynamodb:eu-west-1:123456789012:table/Table{}',
+        'arn:aws:fsx:eu-west-1:123456789012:file-system/fs-{:017x}',
+        'arn:aws:s3:::bucket-{}',
+        'arn:aws:storagegateway:eu-west-1:123456789012:gateway/sgw-{0:08X}/volume/vol-{0:08X}',
+    ]
+    distinct_arns = [template.format(number) for number in range(300) for template in templates]
+    rows = [random.choice(distinct_arns) for _ in range(1000000)]
+
+    for name, function in [('split on / (extract_instance_id)', extract_instance_id),
+                           ('split on : (CloudTrail handler)', cloudtrail_resource_id),
+                           ('parse_arn (memoized)', resource_id_from_arn)]:
+        start = time.perf_counter()
+        for arn in rows:
+            function(arn)
+        elapsed = time.perf_counter() - start
+        print(f'{name}: {elapsed:.3f}s ({len(rows) / elapsed:,.0f} rows/s)')
+    print(parse_arn.cache_info())
+    for arn in distinct_arns[:len(templates)]:
+        print(f'{arn} -> {parse_arn(arn)}')
@@ -0,0 +1,108 @@
+import os
+import csv
+import codecs
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from fetch_engine import DEFAULT_MAX_WORKERS
+
+# Backup Audit Manager BACKUP_JOB_REPORT columns mapped onto the list_backup_jobs record keys
+# that write_to_csv reads. Column names are matched case-insensitively.
+COLUMN_MAP = {
+    'account id': 'AccountId',
+    'region': 'AwsRegion',
+    'backup job id': 'BackupJobId',
+    'job status': 'State',
+    'status message': 'StatusMessage',
+    'message category': 'MessageCategory',
+    'resource type': 'ResourceType',
+    'resource arn': 'ResourceArn',
+    'resource name': 'ResourceName',
+    'creation date': 'CreationDate',
+    'completion date': 'CompletionDate',
+    'expected completion date': 'ExpectedCompletionDate',
+    'start by': 'StartBy',
+    'backup size in bytes': 'BackupSizeInBytes',
+    'backup vault name': 'BackupVaultName',
+    'backup vault arn': 'BackupVaultArn',
+    'recovery point arn': 'RecoveryPointArn',
+    'backup plan arn': 'BackupPlanArn',
+}
+DATE_KEYS = {'CreationDate', 'CompletionDate', 'ExpectedCompletionDate', 'StartBy'}
+
+def parse_report_date(value):
+    # Report timestamps look like 2024-04-01T10:00:00Z or 2024-04-01 10:00:00 UTC
+    if not value:
+        return ''
+    try:
+        parsed = datetime.fromisoformat(value.replace(' UTC', '').replace('Z', '').replace(' ', 'T'))
+    except ValueError:
+        return value
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def row_to_job(row):
+    job = {}
+    for column, value in row.items():
+        key = COLUMN_MAP.get((column or '').strip().lower())
+        if key is None:
+            continue
+        if key in DATE_KEYS:
+            value = parse_report_date(value)
+        elif key == 'BackupSizeInBytes':
+            value = int(float(value)) if value else 0
+        job[key] = value
+    return job
+
+def report_day_prefix(prefix, account_id, region, report_plan_name, day):
+    # Report plans deliver to <prefix>/Backup/<account>/<region>/<yyyy>/<mm>/<dd>/<report plan>/
+    base = f'{prefix.strip("/")}/' if prefix else ''
+    return f'{base}Backup/{account_id}/{region}/{day.strftime("%Y/%m/%d")}/{report_plan_name}/'
+
+def discover_report_files(s3_client, bucket_name, prefix, account_id, region, report_plan_name, start_datetime, end_datetime, max_workers=DEFAULT_MAX_WORKERS):
+    # List each day's delivery folder in parallel, including the day after the range,
+    # since a daily report covers the 24 hours before it is delivered
+    days = []
+    day = datetime(start_datetime.year, start_datetime.month, start_datetime.day)
+    while day <= end_datetime.replace(tzinfo=None) + timedelta(days=1):
+        days.append(day)
+        day += timedelta(days=1)
+
+    def list_day(day):
+        keys = []
+        paginator = s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=report_day_prefix(prefix, account_id, region, report_plan_name, day)):
+            keys.extend(item['Key'] for item in page.get('Contents', []) if item['Key'].endswith('.csv'))
+        return sorted(keys)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return [key for keys in executor.map(list_day, days) for key in keys]
+
+def read_report_file(s3_client, bucket_name, key):
+    # Stream-decode the object body row by row instead of downloading it first
+    body = s3_client.get_object(Bucket=bucket_name, Key=key)['Body']
+    return [row_to_job(row) for row in csv.DictReader(codecs.getreader('utf-8-sig')(body))]
+
+def load_jobs_from_audit_reports(s3_client, bucket_name, prefix, account_id, region, report_plan_name, start_datetime, end_datetime, max_workers=DEFAULT_MAX_WORKERS):
+    # Build the job set for a range from report plan deliveries alone, without Backup API calls
+    keys = discover_report_files(s3_client, bucket_name, prefix, account_id, region, report_plan_name, start_datetime, end_datetime, max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        files = list(executor.map(lambda key: read_report_file(s3_client, bucket_name, key), keys))
+
+    # A job can appear in several daily files; later deliveries carry its latest state
+    start_utc = start_datetime.replace(tzinfo=start_datetime.tzinfo or timezone.utc)
+    end_utc = end_datetime.replace(tzinfo=end_datetime.tzinfo or timezone.utc)
+    jobs = {}
+    for file_jobs in files:
+        for job in file_jobs:
+            creation_date = job.get('CreationDate')
+            if isinstance(creation_date, datetime) and not start_utc <= creation_date < end_utc:
+                continue
+            jobs[job.get('BackupJobId') or id(job)] = job
+    return list(jobs.values())
+
+def audit_report_settings():
+    # Report plan delivery location, from the Lambda environment
+    return {
+        'bucket_name': os.environ['AUDIT_REPORT_BUCKET'],
+        'prefix': os.environ.get('AUDIT_REPORT_PREFIX', ''),
+        'report_plan_name': os.environ['AUDIT_REPORT_PLAN_NAME'],
+    }
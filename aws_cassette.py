@@ -0,0 +1,191 @@
+import io
+import re
+import sys
+import gzip
+import json
+import time
+import base64
+import hashlib
+import threading
+import importlib
+from collections import deque
+import json_codec
+from json_codec import encode
+
+ACCOUNT_ID_PATTERN = re.compile(r'(?<!\d)\d{12}(?!\d)')
+
+def scrub_account_id(match):
+    # Replace each account ID with a stable fake one so distinct accounts stay distinct
+    return f'{int(hashlib.sha256(match.group(0).encode()).hexdigest(), 16) % 10 ** 12:012d}'
+
+def scrub(value):
+    if isinstance(value, str):
+        return ACCOUNT_ID_PATTERN.sub(scrub_account_id, value)
+    if isinstance(value, dict):
+        return {scrub(key): scrub(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [scrub(item) for item in value]
+    return value
+
+def scrub_bytes(data):
+    return scrub(data.decode('latin-1')).encode('latin-1')
+
+def scrub_body(data):
+    # Account IDs in a gzip body (resource_stats.json.gz, .csv.gz reports) sit inside the
+    # deflate stream, so the body is decompressed, scrubbed and compressed again
+    if data[:2] == b'\x1f\x8b':
+        try:
+            return gzip.compress(scrub_bytes(gzip.decompress(data)), mtime=0)
+        except (OSError, EOFError):
+            pass  # A byte range of a gzip object; only the raw bytes can be scrubbed
+    return scrub_bytes(data)
+
+def decode_stream(data):
+    from botocore.response import StreamingBody
+    data = base64.b64decode(data)
+    return StreamingBody(io.BytesIO(data), len(data))
+
+# Recorded streaming bodies are replayed as fresh botocore streams
+CASSETTE_DECODERS = dict(json_codec.DECODERS, __stream__=decode_stream)
+
+def decode(value):
+    return json_codec.decode(value, CASSETTE_DECODERS)
+
+def request_key(service, operation, params):
+    # Match requests on their scrubbed API parameters so recordings replay across accounts
+    canonical = json.dumps(scrub(encode(params)), sort_keys=True, default=str)
+    return f'{service}.{operation}.{hashlib.sha1(canonical.encode()).hexdigest()}'
+
+class Cassette:
+    # Records botocore responses into a gzip JSON-lines file, or replays them without network.
+    # latency='original' sleeps for each recorded call's duration, latency='none' returns at once.
+    def __init__(self, path, mode='replay', latency='none'):
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.interactions = []
+        self._lock = threading.Lock()
+        self._by_key = {}
+        self._by_operation = {}
+        self._consumed = set()
+        if mode == 'replay':
+            self.load()
+
+    def load(self):
+        with gzip.open(self.path, 'rt') as cassette_file:
+            for line in cassette_file:
+                interaction = json.loads(line)
+                index = len(self.interactions)
+                self.interactions.append(interaction)
+                self._by_key.setdefault(interaction['key'], deque()).append(index)
+                self._by_operation.setdefault((interaction['service'], interaction['operation']), deque()).append(index)
+
+    def save(self):
+        with gzip.open(self.path, 'wt') as cassette_file:
+            for interaction in self.interactions:
+                cassette_file.write(json.dumps(interaction) + '\n')
+
+    def register(self, events):
+        # Hook a botocore event emitter (a client's or a session's)
+        events.register('before-parameter-build', self.before_parameter_build)
+        events.register_first('before-call', self.before_call)
+        if self.mode == 'record':
+            events.register('after-call', self.after_call)
+
+    def unregister(self, events):
+        events.unregister('before-parameter-build', self.before_parameter_build)
+        events.unregister('before-call', self.before_call)
+        if self.mode == 'record':
+            events.unregister('after-call', self.after_call)
+
+    def before_parameter_build(self, params, model, context, **kwargs):
+        context['cassette_key'] = request_key(model.service_model.service_name, model.name, params)
+
+    def before_call(self, model, context, **kwargs):
+        if self.mode == 'record':
+            context['cassette_start'] = time.perf_counter()
+            return None
+        interaction = self.next_interaction(model.service_model.service_name, model.name, context.get('cassette_key'))
+        if self.latency == 'original':
+            time.sleep(interaction['latency'])
+        from botocore.awsrequest import AWSResponse
+        http_response = AWSResponse('', interaction['status_code'], {}, None)
+        return http_response, decode(interaction['response'])
+
+    def next_interaction(self, service, operation, key):
+        # Prefer the recorded call with identical parameters, then fall back to recording order
+        with self._lock:
+            for queue in (self._by_key.get(key), self._by_operation.get((service, operation))):
+                while queue:
+                    index = queue.popleft()
+                    if index not in self._consumed:
+                        self._consumed.add(index)
+                        return self.interactions[index]
+        raise LookupError(f'No recorded response left for {service}.{operation} in {self.path}')
+
+    def after_call(self, http_response, parsed, model, context, **kwargs):
+        latency = max(0.0, time.perf_counter() - context.get('cassette_start', time.perf_counter()))
+        response = dict(parsed)
+        # Streaming bodies can only be read once; keep the bytes and hand the caller a fresh stream
+        body = response.get('Body')
+        if hasattr(body, 'read'):
+            from botocore.response import StreamingBody
+            data = body.read()
+            parsed['Body'] = StreamingBody(io.BytesIO(data), len(data))
+            response['Body'] = {'__stream__': base64.b64encode(scrub_body(data)).decode('ascii')}
+        response.pop('ResponseMetadata', None)
+        with self._lock:
+            self.interactions.append({
+                'service': model.service_model.service_name,
+                'operation': model.name,
+                'key': context.get('cassette_key', ''),
+                'status_code': http_response.status_code,
+                'latency': latency,
+                'response': scrub(encode(response)),
+            })
+
+class use_cassette:
+    # Context manager hooking the boto3 default session, which every handler's boto3.client() uses.
+    # Sessions created explicitly (report_cli.py) are hooked through attach().
+    active = None
+
+    def __init__(self, path, mode='replay', latency='none'):
+        self.cassette = Cassette(path, mode, latency)
+        self.events = []
+
+    def attach(self, session):
+        self.cassette.register(session.events)
+        self.events.append(session.events)
+
+    def __enter__(self):
+        import boto3
+        if boto3.DEFAULT_SESSION is None:
+            boto3.setup_default_session()
+        self.attach(boto3.DEFAULT_SESSION)
+        use_cassette.active = self
+        return self.cassette
+
+    def __exit__(self, *exc_info):
+        use_cassette.active = None
+        for events in self.events:
+            self.cassette.unregister(events)
+        if self.cassette.mode == 'record':
+            self.cassette.save()
+
+def attach(session):
+    # Hook an explicitly created boto3 session into the active cassette, if any
+    if use_cassette.active is not None:
+        use_cassette.active.attach(session)
+    return session
+
+if __name__ == "__main__":
+    # For testing locally, e.g.:
+    #   python aws_cassette.py record april.jsonl.gz input_month_report '{"month": "4"}'
+    #   python aws_cassette.py replay april.jsonl.gz input_month_report '{"month": "4"}' --original-latency
+    mode, path, module_name = sys.argv[1:4]
+    event = json.loads(sys.argv[4]) if len(sys.argv) > 4 and not sys.argv[4].startswith('--') else {}
+    latency = 'original' if '--original-latency' in sys.argv else 'none'
+    with use_cassette(path, mode, latency):
+        start = time.perf_counter()
+        print(importlib.import_module(module_name).lambda_handler(event, {}))
+        print(f'{mode} run took {time.perf_counter() - start:.2f}s')
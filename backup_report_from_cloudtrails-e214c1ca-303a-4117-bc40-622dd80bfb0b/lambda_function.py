@@ -3,13 +3,17 @@ import boto3
 import json
 import csv
 from datetime import datetime, timedelta
+from arn_parser import resource_id_from_arn
+from compression import compression_from_event, upload_report
+from concurrency_controller import CONTROLLED_CLIENT_CONFIG
+from fetch_engine import paginate
 
 def bytes_to_gib(bytes_size):
     gib_size = bytes_size / (1024 ** 3)  # Convert bytes to gibibytes
     return round(gib_size, 2)
 
 def lambda_handler(event, context):
-    cloudtrail_client = boto3.client('cloudtrail')
+    cloudtrail_client = boto3.client('cloudtrail', config=CONTROLLED_CLIENT_CONFIG)
     sns_client = boto3.client('sns')
     s3_client = boto3.client('s3')
 
@@ -22,16 +26,18 @@ def lambda_handler(event, context):
         start_time = event['startTime']
     if 'endTime' in event:
         end_time = event['endTime']
+    compression = compression_from_event(event)
 
-    response = cloudtrail_client.lookup_events(
+    events = paginate(
+        cloudtrail_client,
+        'lookup_events',
+        'Events',
         LookupAttributes=[
             {'AttributeKey': 'EventName', 'AttributeValue': 'BackupJobCompleted'}
         ],
         StartTime=start_time,
         EndTime=end_time
     )
-
-    events = response.get('Events', [])
     csv_data = [
         ['EVENT TIME', 'STATE', 'PERCENT DONE', 'RESOURCE ID', 'BACKUP SIZE (GiB)', 'RESOURCE TYPE']
     ]
@@ -45,7 +51,7 @@ def lambda_handler(event, context):
         percent_done = service_event_details.get('percentDone', '')
         resource_arn = service_event_details.get('resourceArn', '')
         # Extracting resource ID from the ARN
-        resource_id = resource_arn.split(':')[-1]
+        resource_id = resource_id_from_arn(resource_arn)
         backup_size_bytes = service_event_details.get('backupSizeInBytes', 0)
         backup_size_gib = bytes_to_gib(backup_size_bytes)
         resource_type = service_event_details.get('resourceType', '')
@@ -61,9 +67,8 @@ def lambda_handler(event, context):
 
     # Upload the CSV file to S3
     s3_bucket = os.environ['S3_BUCKET_NAME']
-    s3_key = f'aws-backup-report_{timestamp}.csv'
+    s3_key = upload_report(s3_client, csv_filename, s3_bucket, f'aws-backup-report_{timestamp}.csv', compression)
     s3_object_location = f's3://{s3_bucket}/{s3_key}'
-    s3_client.upload_file(csv_filename, s3_bucket, s3_key)
 
     # Send SNS notification with the generated CSV file as an attachment
     sns_topic_arn = os.environ['SNS_TOPIC_ARN']
@@ -0,0 +1,80 @@
+import os
+import ast
+import sys
+import zipfile
+import argparse
+
+# Builds the deployment zip of a handler that lives in its own directory (such as the
+# CloudTrail handler) from its lambda_function.py and the root modules it imports, so the
+# shared modules are never copied by hand. --check verifies the committed zip instead.
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Fixed entry metadata keeps the zip identical across rebuilds of the same sources
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+def local_imports(path):
+    # Top-level modules imported anywhere in the file that exist as root modules
+    with open(path) as source_file:
+        tree = ast.parse(source_file.read(), path)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split('.')[0])
+    return {name for name in names if os.path.exists(os.path.join(ROOT, f'{name}.py'))}
+
+def package_files(handler_dir):
+    # Archive name -> source path: the handler plus the closure of its root-module imports
+    handler_path = os.path.join(handler_dir, 'lambda_function.py')
+    files = {'lambda_function.py': handler_path}
+    pending = sorted(local_imports(handler_path))
+    while pending:
+        name = pending.pop()
+        if f'{name}.py' in files:
+            continue
+        files[f'{name}.py'] = os.path.join(ROOT, f'{name}.py')
+        pending.extend(sorted(local_imports(files[f'{name}.py'])))
+    return files
+
+def read_files(files):
+    contents = {}
+    for archive_name, path in files.items():
+        with open(path, 'rb') as source_file:
+            contents[archive_name] = source_file.read()
+    return contents
+
+def build(handler_dir, zip_path):
+    contents = read_files(package_files(handler_dir))
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for archive_name in sorted(contents):
+            info = zipfile.ZipInfo(archive_name, ZIP_DATE_TIME)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            archive.writestr(info, contents[archive_name])
+    return sorted(contents)
+
+def check(handler_dir, zip_path):
+    # Names of the files whose packaged copy is missing, stale or no longer needed
+    expected = read_files(package_files(handler_dir))
+    if not os.path.exists(zip_path):
+        return sorted(expected)
+    with zipfile.ZipFile(zip_path) as archive:
+        packaged = {name: archive.read(name) for name in archive.namelist()}
+    return sorted(name for name in expected.keys() | packaged.keys() if expected.get(name) != packaged.get(name))
+
+if __name__ == "__main__":
+    # python build_package.py backup_report_from_cloudtrails-<id> [--check]
+    parser = argparse.ArgumentParser(description='Build or check the deployment zip of a handler directory.')
+    parser.add_argument('handler_dir')
+    parser.add_argument('--check', action='store_true', help='Fail if the committed zip does not match the sources')
+    args = parser.parse_args(sys.argv[1:])
+    handler_dir = args.handler_dir.rstrip('/')
+    zip_path = f'{handler_dir}.zip'
+    if args.check:
+        stale = check(handler_dir, zip_path)
+        if stale:
+            print(f'{zip_path} is out of date ({", ".join(stale)}); run python build_package.py {handler_dir}')
+            sys.exit(1)
+        print(f'{zip_path} is up to date')
+    else:
+        print(f'{zip_path}: {", ".join(build(handler_dir, zip_path))}')
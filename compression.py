@@ -0,0 +1,99 @@
+import os
+import zlib
+from collections import namedtuple
+
+try:
+    import zstandard
+except ImportError:  # zstd output is only available when zstandard is packaged with the function
+    zstandard = None
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Codec: key suffix, Content-Encoding and default level
+Codec = namedtuple('Codec', ['suffix', 'content_encoding', 'default_level'])
+CODECS = {
+    'gzip': Codec('.gz', 'gzip', 6),
+    'zstd': Codec('.zst', 'zstd', 3),
+}
+Compression = namedtuple('Compression', ['codec', 'level'])
+
+CONTENT_TYPES = {
+    '.csv': 'text/csv',
+    '.jsonl': 'application/x-ndjson',
+    '.json': 'application/json',
+    '.parquet': 'application/vnd.apache.parquet',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+# Formats that are compressed containers already and gain nothing from another pass
+ALREADY_COMPRESSED = {'.xlsx', '.parquet'}
+
+def compression_from_event(event):
+    # 'compression': 'gzip' (default) | 'zstd' | 'none' and 'compression_level', from the
+    # event or the REPORT_COMPRESSION / REPORT_COMPRESSION_LEVEL environment variables
+    codec = str(event.get('compression', os.environ.get('REPORT_COMPRESSION', 'gzip'))).lower()
+    if codec == 'none':
+        return None
+    if codec not in CODECS:
+        raise ValueError(f'Unknown compression: {codec}')
+    if codec == 'zstd' and zstandard is None:
+        print('zstandard is not installed; compressing with gzip instead')
+        codec = 'gzip'
+    level = event.get('compression_level', os.environ.get('REPORT_COMPRESSION_LEVEL'))
+    return Compression(codec, int(level) if level not in (None, '') else CODECS[codec].default_level)
+
+def content_type(key):
+    return CONTENT_TYPES.get(os.path.splitext(key)[1].lower(), 'application/octet-stream')
+
+def compresses(key, compression):
+    return compression is not None and os.path.splitext(key)[1].lower() not in ALREADY_COMPRESSED
+
+def compressed_key(key, compression):
+    # Key the object is stored under: report.csv becomes report.csv.gz
+    return key + CODECS[compression.codec].suffix if compresses(key, compression) else key
+
+class GzipReader:
+    # Readable gzip stream over an uncompressed file, so the upload reads compressed
+    # chunks as the file is read instead of from a second file on /tmp
+    def __init__(self, fileobj, level):
+        self.fileobj = fileobj
+        # wbits=31 writes the gzip header and trailer; the header carries no mtime,
+        # so equal content gives equal bytes
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        self.buffer = b''
+        self.finished = False
+
+    def read(self, size=-1):
+        while not self.finished and (size < 0 or len(self.buffer) < size):
+            chunk = self.fileobj.read(READ_CHUNK_SIZE)
+            if chunk:
+                self.buffer += self.compressor.compress(chunk)
+            else:
+                self.buffer += self.compressor.flush()
+                self.finished = True
+        if size < 0:
+            data, self.buffer = self.buffer, b''
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+def compressed_reader(fileobj, compression):
+    if compression.codec == 'zstd':
+        return zstandard.ZstdCompressor(level=compression.level).stream_reader(fileobj)
+    return GzipReader(fileobj, compression.level)
+
+def upload_report(s3_client, filename, bucket_name, s3_key, compression=None, extra_args=None):
+    # Upload a report file, compressing it on the way when requested. The object keeps the
+    # report's Content-Type plus a Content-Encoding, and a Content-Disposition naming the
+    # uncompressed file, so browsers save the plain report and the CLI gets a .gz/.zst file.
+    # Returns the key the object was stored under.
+    extra_args = dict(extra_args or {}, ContentType=content_type(s3_key))
+    if not compresses(s3_key, compression):
+        s3_client.upload_file(filename, bucket_name, s3_key, ExtraArgs=extra_args)
+        return s3_key
+
+    stored_key = compressed_key(s3_key, compression)
+    extra_args['ContentEncoding'] = CODECS[compression.codec].content_encoding
+    extra_args['ContentDisposition'] = f'attachment; filename="{os.path.basename(s3_key)}"'
+    with open(filename, 'rb') as report_file:
+        s3_client.upload_fileobj(compressed_reader(report_file, compression), bucket_name, stored_key, ExtraArgs=extra_args)
+    return stored_key
@@ -0,0 +1,190 @@
+import random
+import threading
+import time
+from botocore.config import Config
+
+# Error codes returned by AWS Backup, CloudTrail, S3 and SNS when a caller is throttled
+THROTTLING_ERROR_CODES = {
+    'ThrottlingException',
+    'Throttling',
+    'TooManyRequestsException',
+    'RequestLimitExceeded',
+    'SlowDown',
+}
+
+# Server-side errors worth retrying; they back off like throttles but leave the limit alone
+TRANSIENT_ERROR_CODES = {
+    'InternalFailure',
+    'InternalError',
+    'ServiceUnavailable',
+    'RequestTimeout',
+    'RequestTimeoutException',
+}
+
+# Config for clients whose calls go through the controller. Botocore's own retry handler
+# would retry throttles before the controller sees them, and multiply its attempts, so
+# it is switched off and the AIMD loop owns backoff.
+CONTROLLED_CLIENT_CONFIG = Config(retries={'mode': 'standard', 'total_max_attempts': 1})
+
+def error_code(error):
+    # Botocore ClientErrors carry the service error code in error.response
+    response = getattr(error, 'response', None) or {}
+    return response.get('Error', {}).get('Code', '')
+
+def is_throttling_error(error):
+    return error_code(error) in THROTTLING_ERROR_CODES
+
+def is_transient_error(error):
+    response = getattr(error, 'response', None) or {}
+    status = response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+    return error_code(error) in TRANSIENT_ERROR_CODES or status >= 500
+
+class AimdLimiter:
+    # Additive-increase / multiplicative-decrease limit on in-flight requests for one
+    # (service, account, region). Each success adds additive_increase / limit, so the
+    # limit grows by roughly additive_increase per full window of successful calls;
+    # each throttle multiplies it by decrease_factor.
+    def __init__(self, initial_limit=4, min_limit=1, max_limit=64, additive_increase=1.0, decrease_factor=0.5):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.additive_increase = additive_increase
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.successes = 0
+        self.throttles = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.throttles += 1
+                self.limit = max(float(self.min_limit), self.limit * self.decrease_factor)
+            else:
+                self.successes += 1
+                self.limit = min(float(self.max_limit), self.limit + self.additive_increase / self.limit)
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'concurrency': int(self.limit),
+                'in_flight': self.in_flight,
+                'successes': self.successes,
+                'throttles': self.throttles,
+            }
+
+class ConcurrencyController:
+    # Shares one AimdLimiter per (service, account, region) across every fetcher
+    def __init__(self, max_attempts=8, base_backoff=0.1, max_backoff=5.0, **limiter_options):
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.limiter_options = limiter_options
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, service, account_id='', region=''):
+        key = (service, account_id, region)
+        with self._lock:
+            if key not in self._limiters:
+                self._limiters[key] = AimdLimiter(**self.limiter_options)
+            return self._limiters[key]
+
+    def limiter_for_client(self, client, account_id=''):
+        # Boto3 clients know their service and region; the account is supplied by the caller
+        meta = getattr(client, 'meta', None)
+        service = meta.service_model.service_name if meta else type(client).__name__
+        region = meta.region_name if meta else ''
+        return self.limiter(service, account_id, region or '')
+
+    def call(self, client, operation, account_id='', **kwargs):
+        # Run one API call under the client's limiter, backing off and retrying when throttled
+        # or on a transient server error. Create the client with CONTROLLED_CLIENT_CONFIG.
+        limiter = self.limiter_for_client(client, account_id)
+        method = getattr(client, operation)
+        for attempt in range(self.max_attempts):
+            limiter.acquire()
+            try:
+                response = method(**kwargs)
+            except Exception as e:
+                throttled = is_throttling_error(e)
+                limiter.release(throttled=throttled)
+                if not (throttled or is_transient_error(e)) or attempt == self.max_attempts - 1:
+                    raise
+                # Full jitter keeps throttled workers from retrying in lockstep
+                time.sleep(random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt)))
+                continue
+            limiter.release()
+            return response
+
+    def stats(self):
+        # Live concurrency level and throttle counts keyed by 'service/account/region'
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {'/'.join(key): limiter.stats() for key, limiter in limiters.items()}
+
+# Controller shared by every paginated call in the project
+default_controller = ConcurrencyController()
+
+if __name__ == "__main__":
+    # For testing locally: a stub API with a token-bucket quota. The controller has to
+    # settle near the concurrency the quota sustains (rate x latency) without a storm of
+    # throttled retries.
+    from concurrent.futures import ThreadPoolExecutor
+
+    class ThrottlingError(Exception):
+        def __init__(self):
+            super().__init__('Rate exceeded')
+            self.response = {'Error': {'Code': 'ThrottlingException'}}
+
+    class StubBackupClient:
+        def __init__(self, requests_per_second, burst, latency):
+            self.requests_per_second = requests_per_second
+            self.burst = burst
+            self.latency = latency
+            self.tokens = float(burst)
+            self.refilled_at = time.monotonic()
+            self.lock = threading.Lock()
+
+        def list_backup_jobs(self, **kwargs):
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(float(self.burst), self.tokens + (now - self.refilled_at) * self.requests_per_second)
+                self.refilled_at = now
+                allowed = self.tokens >= 1
+                if allowed:
+                    self.tokens -= 1
+            time.sleep(self.latency)
+            if not allowed:
+                raise ThrottlingError()
+            return {'BackupJobs': []}
+
+    calls = 600
+    stub = StubBackupClient(requests_per_second=100, burst=10, latency=0.05)
+    sustainable = stub.requests_per_second * stub.latency
+    controller = ConcurrencyController(max_attempts=20, initial_limit=1)
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        for future in [executor.submit(controller.call, stub, 'list_backup_jobs') for _ in range(calls)]:
+            future.result()
+    elapsed = time.monotonic() - start
+    stats = controller.limiter('StubBackupClient').stats()
+    print(f'{calls} calls in {elapsed:.1f}s ({calls / elapsed:.0f} calls/s against a {stub.requests_per_second} calls/s quota)')
+    print(stats)
+
+    assert stats['successes'] == calls
+    # Throttles stay a small fraction of the calls: no retry storm
+    assert stats['throttles'] <= 0.1 * calls, f"{stats['throttles']} throttles for {calls} calls"
+    # The limit converges near the sustainable concurrency instead of running to max_limit
+    assert 1 <= stats['concurrency'] <= 2 * sustainable, f"limit {stats['concurrency']}, sustainable {sustainable:.0f}"
+    # and still uses most of the quota
+    assert calls / elapsed >= 0.5 * stub.requests_per_second, f'{calls / elapsed:.0f} calls/s'
+    print('OK')
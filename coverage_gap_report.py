@@ -0,0 +1,99 @@
+import os
+import boto3
+import csv
+import json
+from datetime import datetime, timedelta
+from compression import compression_from_event, upload_report
+from concurrency_controller import CONTROLLED_CLIENT_CONFIG
+from fetch_engine import fetch_jobs, paginate
+
+FAILED_STATES = {'FAILED', 'ABORTED', 'EXPIRED', 'PARTIAL'}
+
+def find_coverage_gaps(protected_resources, jobs):
+    # Set-based gap detection, linear in resources + jobs with no per-resource API calls
+    resources = {resource['ResourceArn']: resource for resource in protected_resources}
+    latest_jobs = {}
+    successful = set()
+    for job in jobs:
+        resource_arn = job.get('ResourceArn', '')
+        if job.get('State', '') == 'COMPLETED':
+            successful.add(resource_arn)
+        latest = latest_jobs.get(resource_arn)
+        if latest is None or job.get('CreationDate') > latest.get('CreationDate'):
+            latest_jobs[resource_arn] = job
+
+    no_success = resources.keys() - successful
+    last_failed = {arn for arn in resources.keys() & latest_jobs.keys() if latest_jobs[arn].get('State', '') in FAILED_STATES}
+
+    gaps = []
+    for arn in sorted(no_success | last_failed):
+        resource = resources[arn]
+        latest = latest_jobs.get(arn, {})
+        gaps.append({
+            'Resource ID': arn,
+            'Resource Type': resource.get('ResourceType', ''),
+            'Resource Name': resource.get('ResourceName', ''),
+            'Gap': 'NO_SUCCESSFUL_BACKUP' if arn in no_success else 'LAST_JOB_FAILED',
+            'Last Backup Time': resource.get('LastBackupTime', ''),
+            'Last Job State': latest.get('State', ''),
+            'Last Job Status Message': latest.get('StatusMessage', ''),
+        })
+    return gaps
+
+def write_to_csv(gaps, csv_filename):
+    # Write the coverage gaps to a CSV file
+    with open(csv_filename, 'w', newline='') as csvfile:
+        fieldnames = ['Resource ID', 'Resource Type', 'Resource Name', 'Gap', 'Last Backup Time', 'Last Job State', 'Last Job Status Message']
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(gaps)
+
+def lambda_handler(event, context):
+    # Retrieve environment variables
+    s3_bucket_name = os.environ['S3_BUCKET_NAME']
+    sns_topic_arn = os.environ['SNS_TOPIC_ARN']
+
+    # Resources without a successful job in the last N days count as gaps (default 7)
+    days = int(event.get('days', 7))
+    end_datetime = datetime.utcnow()
+    start_datetime = end_datetime - timedelta(days=days)
+
+    backup_client = boto3.client('backup', config=CONTROLLED_CLIENT_CONFIG)
+    s3_client = boto3.client('s3')
+    sns_client = boto3.client('sns')
+
+    # Pull the protected resources and the window's job set once
+    protected_resources = paginate(backup_client, 'list_protected_resources', 'Results')
+    jobs = fetch_jobs(backup_client, start_datetime, end_datetime)['backup']
+    gaps = find_coverage_gaps(protected_resources, jobs)
+
+    # Generate a timestamp for the report
+    timestamp = datetime.utcnow().strftime('%Y-%m-%d-%H-%M')
+
+    # Write the output to a CSV file and upload it to the specified S3 bucket
+    csv_filename = f'/tmp/coverage_gaps_{timestamp}.csv'
+    write_to_csv(gaps, csv_filename)
+    s3_key = f'backup_report/coverage_gaps_{timestamp}.csv'
+    s3_key = upload_report(s3_client, csv_filename, s3_bucket_name, s3_key, compression_from_event(event))
+
+    # Send SNS notification with the gap counts and the timestamped S3 key
+    no_success_count = sum(1 for gap in gaps if gap['Gap'] == 'NO_SUCCESSFUL_BACKUP')
+    sns_client.publish(
+        TopicArn=sns_topic_arn,
+        Subject='AWS Backup Coverage Gap Report',
+        Message=(
+            f'{len(protected_resources)} protected resources checked against the last {days} days: '
+            f'{no_success_count} without a successful backup, {len(gaps) - no_success_count} whose last job failed.\n'
+            f'The coverage gap report is available at: s3://{s3_bucket_name}/{s3_key}'
+        )
+    )
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps('CSV file generated and SNS notification sent successfully!')
+    }
+
+if __name__ == "__main__":
+    # For testing locally
+    event = {'days': '7'}
+    lambda_handler(event, {})
@@ -0,0 +1,178 @@
+import os
+import json
+import boto3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from fetch_engine import DEFAULT_MAX_WORKERS, fetch_window
+
+# S3 prefix holding one JSON partition of backup jobs per creation day
+EVENT_PARTITION_PREFIX = 'backup_events'
+DATE_FIELDS = ('CreationDate', 'CompletionDate', 'StartBy', 'ExpectedCompletionDate', 'EventTime')
+# Event details carry these as JSON strings; list_backup_jobs returns them as numbers
+NUMERIC_FIELDS = ('BackupSizeInBytes', 'BytesTransferred')
+CONDITIONAL_WRITE_ERRORS = ('PreconditionFailed', 'ConditionalRequestConflict')
+MAX_UPSERT_ATTEMPTS = 10
+
+def parse_timestamp(value):
+    # EventBridge timestamps end with 'Z', which datetime.fromisoformat only accepts from Python 3.11
+    if isinstance(value, datetime) or not value:
+        return value
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+def parse_number(value):
+    if isinstance(value, (int, float)) or value in (None, ''):
+        return value or 0
+    return int(float(value))
+
+def partition_key(day):
+    return f'{EVENT_PARTITION_PREFIX}/{day.strftime("%Y/%m/%d")}/jobs.json'
+
+def complete_marker_key(day):
+    # Written once a closed day's partition has been reconciled against list_backup_jobs
+    return f'{EVENT_PARTITION_PREFIX}/{day.strftime("%Y/%m/%d")}/_COMPLETE'
+
+def event_to_job(backup_event):
+    # Turn an EventBridge 'Backup Job State Change' event into a list_backup_jobs style record
+    detail = backup_event.get('detail', {})
+    job = {key[:1].upper() + key[1:]: value for key, value in detail.items()}
+    job.setdefault('AccountId', backup_event.get('account', ''))
+    job['AwsRegion'] = backup_event.get('region', '')
+    job['EventTime'] = backup_event.get('time', '')
+    for field in DATE_FIELDS:
+        if job.get(field):
+            job[field] = parse_timestamp(job[field]).isoformat()
+    for field in NUMERIC_FIELDS:
+        if field in job:
+            job[field] = parse_number(job[field])
+    return job
+
+def job_from_partition(job):
+    # Partitions store ISO strings; the report writers expect datetimes and numbers like the
+    # Backup API returns (partitions written before sizes were converted may hold strings)
+    job = {key: parse_timestamp(value) if key in DATE_FIELDS else value for key, value in job.items()}
+    for field in NUMERIC_FIELDS:
+        if field in job:
+            job[field] = parse_number(job[field])
+    return job
+
+def job_to_partition(job):
+    return {key: value.isoformat() if isinstance(value, datetime) else value for key, value in job.items()}
+
+def merge_job(existing, incoming):
+    # State change events can arrive out of order; keep the most recent one per job
+    if existing is None or incoming.get('EventTime', '') >= existing.get('EventTime', ''):
+        return incoming
+    return existing
+
+def error_code(error):
+    response = getattr(error, 'response', None) or {}
+    return response.get('Error', {}).get('Code', '')
+
+def read_partition(s3_client, bucket_name, key):
+    # Return the partition contents and its ETag, or (None, None) if it does not exist yet
+    try:
+        response = s3_client.get_object(Bucket=bucket_name, Key=key)
+    except Exception as e:
+        if error_code(e) in ('NoSuchKey', '404'):
+            return None, None
+        raise
+    return json.loads(response['Body'].read()), response['ETag']
+
+def upsert_partition(s3_client, bucket_name, key, jobs):
+    # Read-merge-write the partition with an S3 conditional write so concurrent
+    # deliveries never overwrite each other; on a lost race, re-read and retry.
+    # Returns the merged partition.
+    for _ in range(MAX_UPSERT_ATTEMPTS):
+        partition, etag = read_partition(s3_client, bucket_name, key)
+        partition = partition or {}
+        for job in jobs:
+            job_id = job.get('BackupJobId', '')
+            partition[job_id] = merge_job(partition.get(job_id), job)
+        condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+        try:
+            s3_client.put_object(
+                Bucket=bucket_name,
+                Key=key,
+                Body=json.dumps(partition).encode('utf-8'),
+                ContentType='application/json',
+                **condition
+            )
+            return partition
+        except Exception as e:
+            if error_code(e) not in CONDITIONAL_WRITE_ERRORS:
+                raise
+    raise RuntimeError(f'Could not update {key} after {MAX_UPSERT_ATTEMPTS} conditional write attempts')
+
+def lambda_handler(event, context):
+    # Consume an SQS batch of EventBridge 'Backup Job State Change' events
+    s3_bucket_name = os.environ['S3_BUCKET_NAME']
+    s3_client = boto3.client('s3')
+
+    # Group the batch by creation-day partition so each partition is written once, and
+    # report failed messages individually so SQS only redelivers those (ReportBatchItemFailures)
+    partitions = {}
+    batch_item_failures = []
+    for record in event.get('Records', []):
+        try:
+            job = event_to_job(json.loads(record['body']))
+            day = parse_timestamp(job.get('CreationDate') or job['EventTime'])
+            partitions.setdefault(partition_key(day), []).append((record['messageId'], job))
+        except Exception as e:
+            print(f"Error parsing message {record.get('messageId')}: {e}")
+            batch_item_failures.append({'itemIdentifier': record.get('messageId')})
+
+    for key, entries in partitions.items():
+        try:
+            upsert_partition(s3_client, s3_bucket_name, key, [job for _, job in entries])
+        except Exception as e:
+            print(f'Error updating partition {key}: {e}')
+            batch_item_failures.extend({'itemIdentifier': message_id} for message_id, _ in entries)
+
+    return {'batchItemFailures': batch_item_failures}
+
+def is_complete(s3_client, bucket_name, day):
+    try:
+        s3_client.head_object(Bucket=bucket_name, Key=complete_marker_key(day))
+    except Exception as e:
+        if error_code(e) in ('NoSuchKey', '404', 'NotFound'):
+            return False
+        raise
+    return True
+
+def load_day(s3_client, bucket_name, backup_client, day, account_id=''):
+    # Read one day partition. A closed day is reconciled against the Backup API once, so
+    # jobs the events missed (e.g. on the day ingestion was switched on) are merged in,
+    # and then marked complete; the current day reads its partition as it fills from
+    # events, or the Backup API while it has none.
+    closed = day + timedelta(days=1) <= datetime.utcnow()
+    if not closed or is_complete(s3_client, bucket_name, day):
+        partition, _ = read_partition(s3_client, bucket_name, partition_key(day))
+        if partition is not None:
+            return [job_from_partition(job) for job in partition.values()]
+    jobs = fetch_window(backup_client, 'backup', day, day + timedelta(days=1), account_id)
+    if not closed:
+        return jobs
+    # Event records carry an EventTime and win over the API copies of the same job
+    partition = upsert_partition(s3_client, bucket_name, partition_key(day), [job_to_partition(job) for job in jobs])
+    s3_client.put_object(Bucket=bucket_name, Key=complete_marker_key(day), Body=b'')
+    return [job_from_partition(job) for job in partition.values()]
+
+def load_jobs(s3_client, bucket_name, backup_client, start_datetime, end_datetime, max_workers=DEFAULT_MAX_WORKERS, account_id=''):
+    # Read the day partitions covering the range in parallel and keep jobs created inside it.
+    # Days that have not started yet hold no jobs, so a current-month range stops at now
+    # instead of asking the Backup API about every future day.
+    day = datetime(start_datetime.year, start_datetime.month, start_datetime.day)
+    last = min(end_datetime.replace(tzinfo=None), datetime.utcnow())
+    days = []
+    while day < last:
+        days.append(day)
+        day += timedelta(days=1)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        day_jobs = list(executor.map(lambda d: load_day(s3_client, bucket_name, backup_client, d, account_id), days))
+
+    start_utc = start_datetime.replace(tzinfo=start_datetime.tzinfo or timezone.utc)
+    end_utc = end_datetime.replace(tzinfo=end_datetime.tzinfo or timezone.utc)
+    return [
+        job for jobs in day_jobs for job in jobs
+        if not isinstance(job.get('CreationDate'), datetime) or start_utc <= job['CreationDate'] < end_utc
+    ]
@@ -0,0 +1,95 @@
+import os
+import gzip
+import json
+import heapq
+import shutil
+import tempfile
+import uuid
+from json_codec import decode, encode
+
+# Rows held in memory before a sorted run is spilled
+DEFAULT_MEMORY_BUDGET_ROWS = int(os.environ.get('SORT_MEMORY_BUDGET_ROWS', '200000'))
+
+def sort_key(fields):
+    # Missing values sort last, and never get compared against present ones
+    def key(job):
+        return tuple((0, job[field]) if job.get(field) not in (None, '') else (1, '') for field in fields)
+    return key
+
+class LocalRunStore:
+    # Sorted runs as gzip JSON-lines files under a private /tmp directory
+    def __init__(self, spill_dir='/tmp'):
+        self.directory = tempfile.mkdtemp(prefix='sort_runs_', dir=spill_dir)
+        self.runs = []
+
+    def write_run(self, rows):
+        path = os.path.join(self.directory, f'run_{len(self.runs):05d}.jsonl.gz')
+        with gzip.open(path, 'wt') as run_file:
+            for row in rows:
+                run_file.write(json.dumps(encode(row)) + '\n')
+        self.runs.append(path)
+
+    def read_run(self, path):
+        with gzip.open(path, 'rt') as run_file:
+            for line in run_file:
+                yield decode(json.loads(line))
+
+    def cleanup(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+class S3RunStore:
+    # Sorted runs as gzip JSON-lines objects, for sorts that do not fit in Lambda's /tmp
+    def __init__(self, s3_client, bucket_name, prefix='backup_report/sort_runs'):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.prefix = f'{prefix}/{uuid.uuid4()}'
+        self.runs = []
+
+    def write_run(self, rows):
+        key = f'{self.prefix}/run_{len(self.runs):05d}.jsonl.gz'
+        body = gzip.compress(''.join(json.dumps(encode(row)) + '\n' for row in rows).encode('utf-8'))
+        self.s3_client.put_object(Bucket=self.bucket_name, Key=key, Body=body)
+        self.runs.append(key)
+
+    def read_run(self, key):
+        body = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)['Body']
+        with gzip.GzipFile(fileobj=body) as run_file:
+            for line in run_file:
+                yield decode(json.loads(line))
+
+    def cleanup(self):
+        for key in self.runs:
+            self.s3_client.delete_object(Bucket=self.bucket_name, Key=key)
+
+def sort_jobs(jobs, fields=('CreationDate', 'ResourceArn'), memory_budget_rows=DEFAULT_MEMORY_BUDGET_ROWS, run_store=None):
+    # External merge sort for streamed rows: spill sorted runs of at most memory_budget_rows
+    # rows, then stream a k-way merge of the runs. Inputs that fit in the budget are sorted
+    # in memory, and so are lists: their rows are already held by the caller, so spilling
+    # would free nothing and the merge would decode a second copy of every row.
+    key = sort_key(fields)
+    if isinstance(jobs, list):
+        yield from sorted(jobs, key=key)
+        return
+    buffer = []
+    store = None
+    try:
+        for job in jobs:
+            buffer.append(job)
+            if len(buffer) >= memory_budget_rows:
+                store = store or run_store or LocalRunStore()
+                buffer.sort(key=key)
+                store.write_run(buffer)
+                buffer = []
+        buffer.sort(key=key)
+        if store is None:
+            yield from buffer
+            return
+        streams = [store.read_run(run) for run in store.runs]
+        yield from heapq.merge(*streams, buffer, key=key)
+    finally:
+        if store is not None:
+            store.cleanup()
+
+def sort_fields_from_event(event):
+    # 'sort_by': 'CreationDate,ResourceArn' in the event turns on sorted output
+    return tuple(field.strip() for field in event.get('sort_by', '').split(',') if field.strip())
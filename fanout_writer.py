@@ -0,0 +1,187 @@
+import json
+import queue
+import threading
+from datetime import datetime
+from compression import upload_report
+from rollups import aggregate_jobs, to_rollup
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet output is only available when pyarrow is packaged with the function
+    pyarrow = None
+
+# Records are handed to the sinks in batches; each sink buffers a few batches before
+# the producer waits for it
+BATCH_ROWS = 1000
+QUEUE_BATCHES = 8
+PARQUET_ROW_GROUP_ROWS = 50000
+_DONE = object()
+# Sent instead of _DONE when the producer fails, so no sink uploads a truncated file
+_ABORT = object()
+
+class ProducerAborted(Exception):
+    pass
+
+# Flat job columns kept in Parquet output; nested fields such as CreatedBy are left out
+# so every row group shares one schema
+PARQUET_COLUMNS = [
+    ('BackupJobId', 'string'), ('AccountId', 'string'), ('BackupVaultName', 'string'),
+    ('ResourceArn', 'string'), ('ResourceType', 'string'), ('ResourceName', 'string'),
+    ('State', 'string'), ('StatusMessage', 'string'), ('MessageCategory', 'string'),
+    ('CreationDate', 'timestamp'), ('CompletionDate', 'timestamp'), ('StartBy', 'timestamp'),
+    ('BackupSizeInBytes', 'int'),
+]
+
+def to_json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+def write_jsonl(jobs, filename):
+    # One job record per line, for the log pipeline
+    with open(filename, 'w') as jsonl_file:
+        for job in jobs:
+            jsonl_file.write(json.dumps(job, default=to_json_value) + '\n')
+
+def parquet_schema():
+    types = {'string': pyarrow.string(), 'timestamp': pyarrow.timestamp('us', tz='UTC'), 'int': pyarrow.int64()}
+    return pyarrow.schema([(name, types[kind]) for name, kind in PARQUET_COLUMNS])
+
+def parquet_value(value, kind):
+    if value in (None, ''):
+        return None
+    if kind == 'timestamp':
+        return value if isinstance(value, datetime) else None
+    if kind == 'int':
+        return int(value)
+    return str(value)
+
+def write_parquet(jobs, filename, row_group_rows=PARQUET_ROW_GROUP_ROWS):
+    # Columnar output, written one row group at a time to keep memory flat
+    if pyarrow is None:
+        raise RuntimeError('Parquet output requires the pyarrow package')
+    schema = parquet_schema()
+    columns = {name: [] for name, _ in PARQUET_COLUMNS}
+
+    def flush(writer):
+        writer.write_table(pyarrow.Table.from_pydict(columns, schema=schema))
+        for values in columns.values():
+            values.clear()
+
+    with pyarrow.parquet.ParquetWriter(filename, schema) as writer:
+        for job in jobs:
+            for name, kind in PARQUET_COLUMNS:
+                columns[name].append(parquet_value(job.get(name), kind))
+            if len(columns['BackupJobId']) >= row_group_rows:
+                flush(writer)
+        if columns['BackupJobId']:
+            flush(writer)
+
+def write_summary(jobs, filename):
+    # Job counts and bytes per day, resource type and state, in the rollup layout
+    days = aggregate_jobs(jobs)
+    summary = {
+        'jobs': sum(totals[0] for groups in days.values() for totals in groups.values()),
+        'bytes': sum(totals[1] for groups in days.values() for totals in groups.values()),
+        'days': [to_rollup(day.isoformat(), groups) for day, groups in sorted(days.items())],
+    }
+    with open(filename, 'w') as summary_file:
+        json.dump(summary, summary_file)
+
+# Extra output formats: writer function and file suffix
+FORMAT_WRITERS = {
+    'jsonl': (write_jsonl, 'jsonl'),
+    'parquet': (write_parquet, 'parquet'),
+    'summary': (write_summary, 'summary.json'),
+}
+
+class Sink:
+    # One output format. The writer function reads the records from a queue on its own
+    # thread, and the optional upload(filename, result) runs on that thread afterwards.
+    def __init__(self, name, write_function, filename, upload=None):
+        self.name = name
+        self.write_function = write_function
+        self.filename = filename
+        self.upload = upload
+        self.result = None
+        self.error = None
+        self.finished = False
+
+    def start(self):
+        self.queue = queue.Queue(maxsize=QUEUE_BATCHES)
+        self.thread = threading.Thread(target=self.run, name=f'sink-{self.name}', daemon=True)
+        self.thread.start()
+
+    def records(self):
+        while True:
+            batch = self.queue.get()
+            if batch is _DONE:
+                self.finished = True
+                return
+            if batch is _ABORT:
+                self.finished = True
+                raise ProducerAborted(f'{self.name}: the record producer failed')
+            yield from batch
+
+    def run(self):
+        try:
+            self.result = self.write_function(self.records(), self.filename)
+            if self.upload is not None:
+                self.result = self.upload(self.filename, self.result)
+        except Exception as e:
+            self.error = e
+        finally:
+            # Keep draining after a failure so the producer never blocks on this sink
+            while not self.finished:
+                self.finished = self.queue.get() in (_DONE, _ABORT)
+
+def upload_sink(name, write_function, filename, s3_client, bucket_name, s3_key, compression=None):
+    # A sink that uploads its file, compressed when requested, and returns the S3 location
+    def upload(filename, _):
+        return f's3://{bucket_name}/{upload_report(s3_client, filename, bucket_name, s3_key, compression)}'
+    return Sink(name, write_function, filename, upload)
+
+def format_sinks(formats, s3_client, bucket_name, local_base, key_base, compression=None):
+    # Sinks for the requested extra formats, e.g. ['jsonl', 'parquet', 'summary']
+    sinks = []
+    for name in formats:
+        write_function, suffix = FORMAT_WRITERS[name]
+        sinks.append(upload_sink(name, write_function, f'{local_base}.{suffix}', s3_client, bucket_name, f'{key_base}.{suffix}', compression))
+    return sinks
+
+def fan_out(jobs, sinks, batch_rows=BATCH_ROWS):
+    # Iterate the records once and tee every batch to all sinks; returns each sink's
+    # result by name, or raises the first sink error once every sink has finished
+    for sink in sinks:
+        sink.start()
+    batch = []
+    try:
+        for job in jobs:
+            batch.append(job)
+            if len(batch) >= batch_rows:
+                for sink in sinks:
+                    sink.queue.put(batch)
+                batch = []
+        for sink in sinks:
+            if batch:
+                sink.queue.put(batch)
+            sink.queue.put(_DONE)
+    except BaseException:
+        # The writers stop without finishing their files and nothing is uploaded
+        for sink in sinks:
+            sink.queue.put(_ABORT)
+        raise
+    finally:
+        for sink in sinks:
+            sink.thread.join()
+
+    for sink in sinks:
+        if sink.error is not None:
+            raise sink.error
+    return {sink.name: sink.result for sink in sinks}
+
+def requested_formats(event):
+    # 'extra_formats': ['jsonl', 'parquet', 'summary'] (or a comma-separated string)
+    formats = event.get('extra_formats', [])
+    if isinstance(formats, str):
+        formats = formats.split(',')
+    return [name.strip() for name in formats if name.strip() in FORMAT_WRITERS]
@@ -0,0 +1,119 @@
+import csv
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from concurrency_controller import default_controller
+
+# Operation name and result key for each AWS Backup job listing API
+JOB_APIS = {
+    'backup': ('list_backup_jobs', 'BackupJobs'),
+    'copy': ('list_copy_jobs', 'CopyJobs'),
+    'restore': ('list_restore_jobs', 'RestoreJobs'),
+}
+
+# Common row schema shared by the backup, copy and restore job sections
+COMMON_FIELDNAMES = ['Job Type', 'Job ID', 'Date', 'Resource Type', 'Resource ID', 'Completion Date', 'State', 'Status Message', 'Backup Size (GiB)', 'Source', 'Destination']
+
+DEFAULT_MAX_WORKERS = 8
+
+def plan_windows(start_datetime, end_datetime, window=timedelta(days=1)):
+    # Split the date range into consecutive, non-overlapping windows
+    windows = []
+    window_start = start_datetime
+    while window_start < end_datetime:
+        window_end = min(window_start + window, end_datetime)
+        windows.append((window_start, window_end))
+        window_start = window_end
+    return windows
+
+def paginate(client, operation, result_key, controller=default_controller, account_id='', **kwargs):
+    # Call a paginated AWS API until NextToken is exhausted and return all items.
+    # Every page goes through the shared AIMD controller so parallel fetchers back off together;
+    # account_id selects the limiter when one run reaches several accounts.
+    items = []
+    response = controller.call(client, operation, account_id, **kwargs)
+    while True:
+        items.extend(response.get(result_key, []))
+        next_token = response.get('NextToken', None)
+        if not next_token:
+            break
+        response = controller.call(client, operation, account_id, NextToken=next_token, **kwargs)
+    return items
+
+def fetch_window(backup_client, job_type, window_start, window_end, account_id=''):
+    # Fetch one job type for one window of the plan
+    operation, result_key = JOB_APIS[job_type]
+    return paginate(
+        backup_client,
+        operation,
+        result_key,
+        account_id=account_id,
+        ByCreatedAfter=window_start,
+        ByCreatedBefore=window_end
+    )
+
+def fetch_jobs(backup_client, start_datetime, end_datetime, job_types=('backup',), max_workers=DEFAULT_MAX_WORKERS, window=timedelta(days=1), account_id=''):
+    # Fetch every requested job type over the same window plan on one shared worker pool
+    windows = plan_windows(start_datetime, end_datetime, window)
+    results = {job_type: [] for job_type in job_types}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            (job_type, executor.submit(fetch_window, backup_client, job_type, window_start, window_end, account_id))
+            for job_type in job_types
+            for window_start, window_end in windows
+        ]
+        # Collect in submission order so each section keeps the window order
+        for job_type, future in futures:
+            results[job_type].extend(future.result())
+    return results
+
+def to_common_row(job_type, job):
+    # Map a backup, copy or restore job onto the common row schema
+    if job_type == 'restore':
+        job_id = job.get('RestoreJobId', '')
+        resource_id = job.get('CreatedResourceArn', '')
+        state = job.get('Status', '')
+        source = job.get('RecoveryPointArn', '')
+        destination = job.get('CreatedResourceArn', '')
+    elif job_type == 'copy':
+        job_id = job.get('CopyJobId', '')
+        resource_id = job.get('ResourceArn', '')
+        state = job.get('State', '')
+        source = job.get('SourceBackupVaultArn', '')
+        destination = job.get('DestinationBackupVaultArn', '')
+    else:
+        job_id = job.get('BackupJobId', '')
+        resource_id = job.get('ResourceArn', '')
+        state = job.get('State', '')
+        source = resource_id
+        destination = job.get('BackupVaultArn', '')
+    backup_size_gib = (job.get('BackupSizeInBytes') or 0) / (1024 ** 3)  # Convert bytes to GiB
+    return [
+        job_type,
+        job_id,
+        job.get('CreationDate', ''),
+        job.get('ResourceType', ''),
+        resource_id,
+        job.get('CompletionDate', ''),
+        state,
+        job.get('StatusMessage', ''),
+        round(backup_size_gib, 2),
+        source,
+        destination,
+    ]
+
+def write_section_to_csv(job_type, jobs, csv_filename):
+    # Write one job type section using the common row schema
+    with open(csv_filename, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(COMMON_FIELDNAMES)
+        for job in jobs:
+            writer.writerow(to_common_row(job_type, job))
+
+def requested_job_types(event):
+    # Backup jobs are always fetched; copy and restore jobs are opt-in per invocation
+    job_types = ['backup']
+    if event.get('include_copy_jobs'):
+        job_types.append('copy')
+    if event.get('include_restore_jobs'):
+        job_types.append('restore')
+    return tuple(job_types)
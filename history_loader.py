@@ -0,0 +1,360 @@
+import io
+import os
+import csv
+import json
+import gzip
+import mmap
+import shutil
+import fnmatch
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from concurrency_controller import error_code
+from fetch_engine import DEFAULT_MAX_WORKERS
+from row_serializer import COLUMNS, GIB
+
+try:
+    import zstandard
+except ImportError:  # .zst reports can only be mirrored when zstandard is packaged with the function
+    zstandard = None
+
+# Local mirror of the report objects plus index.json describing them
+DEFAULT_CACHE_DIR = os.environ.get('HISTORY_CACHE_DIR', '/tmp/report_history')
+REPORT_PATTERNS = ('aws-backup-report_*.csv*', 'backup_jobs_*.csv*', 'failed_backup_jobs_*.csv*')
+# Rows per indexed block; a query reads whole blocks whose time range overlaps it
+BLOCK_ROWS = 2048
+INDEX_VERSION = 1
+# Parallel report tasks share one cache directory; syncs within a process take turns
+sync_lock = threading.Lock()
+# Published index (index.json plus an uncompressed copy of every report) that the query
+# endpoint reads in place with byte-range GETs; never listed as reports itself
+PUBLISHED_INDEX_PREFIX = os.environ.get('QUERY_INDEX_PREFIX', 'backup_report/query_index')
+
+# Header of the CloudTrail handler's reports, and its columns mapped onto job record keys
+CLOUDTRAIL_HEADER = ['EVENT TIME', 'STATE', 'PERCENT DONE', 'RESOURCE ID', 'BACKUP SIZE (GiB)', 'RESOURCE TYPE']
+CLOUDTRAIL_COLUMNS = {
+    'EVENT TIME': ('datetime', 'CreationDate'),
+    'STATE': ('text', 'State'),
+    'RESOURCE ID': ('text', 'ResourceArn'),
+    'BACKUP SIZE (GiB)': ('gib', 'BackupSizeInBytes'),
+    'RESOURCE TYPE': ('text', 'ResourceType'),
+}
+# write_to_csv layouts map back through the serializer's column specs; Instance ID is
+# derived from Resource ID and is not read back
+REPORT_COLUMNS = {header: (column.kind, column.key) for header, column in COLUMNS.items() if column.kind != 'resource_id'}
+VARIANT_COLUMNS = {'cloudtrail': CLOUDTRAIL_COLUMNS, 'report': REPORT_COLUMNS}
+
+def detect_variant(header):
+    # Both layouts keep the row time in the first column
+    if header == CLOUDTRAIL_HEADER:
+        return 'cloudtrail'
+    if header and header[0] == 'Date' and set(header) <= COLUMNS.keys():
+        return 'report'
+    return None
+
+def parse_time(text):
+    # Reports hold str(datetime) values such as 2024-02-26 15:37:59+00:00
+    try:
+        parsed = datetime.fromisoformat(text.strip().strip('"'))
+    except ValueError:
+        return None
+    return parsed.astimezone(timezone.utc) if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def row_to_job(header, row, variant):
+    job = {}
+    columns = VARIANT_COLUMNS[variant]
+    for name, value in zip(header, row):
+        kind, key = columns.get(name, ('text', None))
+        if key is None:
+            continue
+        if kind == 'datetime':
+            value = parse_time(value) or value
+        elif kind == 'gib':
+            value = int(float(value) * GIB) if value else 0
+        job[key] = value
+    if variant == 'cloudtrail':
+        # BackupJobCompleted events carry a single time, as in report_cli's CloudTrail source
+        job['CompletionDate'] = job.get('CreationDate', '')
+    return job
+
+def row_end(mm, start, size):
+    # End offset (exclusive, after the newline) of the CSV row starting at start; a newline
+    # inside a quoted field leaves an odd number of quotes and continues the row
+    end = mm.find(b'\n', start)
+    while end != -1 and mm.find(b'"', start, end) != -1 and mm[start:end].count(b'"') % 2:
+        end = mm.find(b'\n', end + 1)
+    return size if end == -1 else end + 1
+
+def scan_file(path, block_rows=BLOCK_ROWS):
+    # Walk the mirrored file through mmap, reading only each row's first column, and
+    # record blocks of rows as (offset, length, rows, first time, last time)
+    size = os.path.getsize(path)
+    if size == 0:
+        return {'variant': None}
+    with open(path, 'rb') as report_file, mmap.mmap(report_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        header_end = row_end(mm, 0, size)
+        header = next(csv.reader([mm[:header_end].decode('utf-8-sig').rstrip('\r\n')]), [])
+        variant = detect_variant(header)
+        if variant is None:
+            return {'variant': None, 'header': header}
+
+        blocks = []
+        block = None
+        position = header_end
+        rows = 0
+        while position < size:
+            end = row_end(mm, position, size)
+            if end - position > 1:
+                comma = mm.find(b',', position, end)
+                row_time = parse_time(mm[position:comma if comma != -1 else end].decode('utf-8'))
+                if block is None:
+                    block = [position, 0, 0, None, None]
+                block[1] = end - block[0]
+                block[2] += 1
+                if row_time is not None:
+                    block[3] = min(block[3], row_time) if block[3] else row_time
+                    block[4] = max(block[4], row_time) if block[4] else row_time
+                rows += 1
+                if block[2] >= block_rows:
+                    blocks.append(block)
+                    block = None
+            position = end
+        if block is not None:
+            blocks.append(block)
+
+    for block in blocks:
+        block[3] = block[3].isoformat() if block[3] else None
+        block[4] = block[4].isoformat() if block[4] else None
+    times = [block[3] for block in blocks if block[3]] + [block[4] for block in blocks if block[4]]
+    return {
+        'variant': variant,
+        'header': header,
+        'rows': rows,
+        'size': size,
+        'min_time': min(times, key=parse_time) if times else None,
+        'max_time': max(times, key=parse_time) if times else None,
+        'blocks': blocks,
+    }
+
+def overlaps(first, last, start, end):
+    # Blocks without times only match unbounded queries
+    if start is None and end is None:
+        return True
+    if first is None:
+        return False
+    return (end is None or parse_time(first) < end) and (start is None or parse_time(last) >= start)
+
+def plain_key(key):
+    # Compressed objects are indexed decompressed, since offsets refer to the plain CSV
+    for suffix in ('.gz', '.zst'):
+        if key.endswith(suffix):
+            return key[:-len(suffix)]
+    return key
+
+def mirror_object(s3_client, bucket_name, key, path):
+    # Download a report object to path, decompressing .gz and .zst objects on the way
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    body = s3_client.get_object(Bucket=bucket_name, Key=key)['Body']
+    if key.endswith('.gz'):
+        body = gzip.GzipFile(fileobj=body)
+    elif key.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError(f'Mirroring {key} requires the zstandard package')
+        body = zstandard.ZstdDecompressor().stream_reader(body)
+    partial_path = path + '.part'
+    with open(partial_path, 'wb') as local_file:
+        shutil.copyfileobj(body, local_file, 1024 * 1024)
+    os.replace(partial_path, path)
+
+def list_report_objects(s3_client, bucket_name, prefix=''):
+    # Report objects under the prefix, keyed 'bucket/key', leaving out the published index
+    objects = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for item in page.get('Contents', []):
+            name = item['Key'].rsplit('/', 1)[-1]
+            if item['Key'].startswith(PUBLISHED_INDEX_PREFIX + '/'):
+                continue
+            if any(fnmatch.fnmatch(name, pattern) for pattern in REPORT_PATTERNS):
+                objects[f'{bucket_name}/{item["Key"]}'] = item
+    return objects
+
+class HistoryIndex:
+    # Mirrors historical report CSVs from S3 to a local cache and keeps a persistent
+    # per-file row and time-range index, so queries read only the blocks they need
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.lock = threading.Lock()
+        self.files = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as index_file:
+                index = json.load(index_file)
+            if index.get('version') == INDEX_VERSION:
+                self.files = index['files']
+
+    def save(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        partial_path = self.index_path + '.part'
+        with open(partial_path, 'w') as index_file:
+            json.dump({'version': INDEX_VERSION, 'files': self.files}, index_file)
+        os.replace(partial_path, self.index_path)
+
+    def local_path(self, bucket_name, key):
+        # Compressed objects are mirrored decompressed, since mmap scans the plain CSV
+        return os.path.join(self.cache_dir, 'files', bucket_name, plain_key(key))
+
+    def sync(self, s3_client, bucket_name, prefix='', max_workers=DEFAULT_MAX_WORKERS):
+        # Mirror and index new or changed report objects under the prefix, and forget
+        # removed ones; unchanged objects (same ETag) are neither downloaded nor rescanned
+        objects = list_report_objects(s3_client, bucket_name, prefix)
+
+        def refresh(index_key):
+            item = objects[index_key]
+            path = self.local_path(bucket_name, item['Key'])
+            mirror_object(s3_client, bucket_name, item['Key'], path)
+            entry = dict(scan_file(path), etag=item['ETag'], path=path)
+            with self.lock:
+                self.files[index_key] = entry
+
+        stale = [index_key for index_key, item in objects.items()
+                 if self.files.get(index_key, {}).get('etag') != item['ETag'] or not os.path.exists(self.files[index_key]['path'])]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(refresh, stale))
+
+        for index_key in [index_key for index_key in self.files if index_key.startswith(f'{bucket_name}/{prefix}') and index_key not in objects]:
+            path = self.files.pop(index_key)['path']
+            if os.path.exists(path):
+                os.remove(path)
+        self.save()
+        return len(stale)
+
+    def block_ranges(self, start=None, end=None):
+        # (index key, offset, length) of every block whose time range overlaps the query
+        ranges = []
+        for index_key in sorted(self.files):
+            entry = self.files[index_key]
+            if entry.get('variant') is None or not overlaps(entry['min_time'], entry['max_time'], start, end):
+                continue
+            ranges.extend((index_key, offset, length) for offset, length, _, first, last in entry['blocks'] if overlaps(first, last, start, end))
+        return ranges
+
+    def read_blocks(self, ranges):
+        # Block bytes from the local mirror, in the order of ranges
+        for index_key, offset, length in ranges:
+            with open(self.files[index_key]['path'], 'rb') as report_file:
+                report_file.seek(offset)
+                yield report_file.read(length)
+
+    def query(self, start=None, end=None, predicate=None):
+        # Yield job records with start <= CreationDate < end, reading only the byte ranges
+        # of blocks whose time range overlaps the query
+        ranges = self.block_ranges(start, end)
+        for (index_key, _, _), data in zip(ranges, self.read_blocks(ranges)):
+            entry = self.files[index_key]
+            for row in csv.reader(io.StringIO(data.decode('utf-8'), newline='')):
+                job = row_to_job(entry['header'], row, entry['variant'])
+                creation_date = job.get('CreationDate')
+                if start is not None or end is not None:
+                    if not isinstance(creation_date, datetime):
+                        continue
+                    if (start is not None and creation_date < start) or (end is not None and creation_date >= end):
+                        continue
+                if predicate is None or predicate(job):
+                    yield job
+
+class S3HistoryIndex(HistoryIndex):
+    # The published index, queried in place: blocks are read from the uncompressed report
+    # copies with byte-range GETs, so nothing is downloaded up front
+    def __init__(self, s3_client, bucket_name, manifest, max_workers=DEFAULT_MAX_WORKERS):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.max_workers = max_workers
+        self.files = manifest.get('files', {})
+
+    def read_block(self, block_range):
+        index_key, offset, length = block_range
+        response = self.s3_client.get_object(
+            Bucket=self.bucket_name,
+            Key=self.files[index_key]['object'],
+            Range=f'bytes={offset}-{offset + length - 1}'
+        )
+        return response['Body'].read()
+
+    def read_blocks(self, ranges):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            yield from executor.map(self.read_block, ranges)
+
+def published_index_key(index_prefix=PUBLISHED_INDEX_PREFIX):
+    return f'{index_prefix}/index.json'
+
+def read_published_index(s3_client, bucket_name, etag=None, index_prefix=PUBLISHED_INDEX_PREFIX):
+    # (manifest, ETag) of the published index; (None, etag) when it still matches etag, and
+    # an empty manifest with no ETag before the first publish
+    condition = {'IfNoneMatch': etag} if etag else {}
+    try:
+        response = s3_client.get_object(Bucket=bucket_name, Key=published_index_key(index_prefix), **condition)
+    except Exception as e:
+        if error_code(e) in ('304', 'NotModified'):
+            return None, etag
+        if error_code(e) in ('NoSuchKey', '404'):
+            return {'version': INDEX_VERSION, 'files': {}}, None
+        raise
+    manifest = json.loads(response['Body'].read())
+    if manifest.get('version') != INDEX_VERSION:
+        manifest = {'version': INDEX_VERSION, 'files': {}}
+    return manifest, response['ETag']
+
+def publish_index(s3_client, bucket_name, prefix='', cache_dir=DEFAULT_CACHE_DIR, max_workers=DEFAULT_MAX_WORKERS, index_prefix=PUBLISHED_INDEX_PREFIX):
+    # Index new or changed report objects under the prefix and publish the index to S3 next
+    # to an uncompressed copy of each report. Meant to run on a schedule, outside any
+    # request path; each changed report passes through cache_dir once and is removed.
+    # Returns the number of reports (re)indexed.
+    manifest, _ = read_published_index(s3_client, bucket_name, index_prefix=index_prefix)
+    files = manifest['files']
+    objects = list_report_objects(s3_client, bucket_name, prefix)
+
+    def index_object(index_key):
+        item = objects[index_key]
+        path = os.path.join(cache_dir, 'publish', bucket_name, plain_key(item['Key']))
+        mirror_object(s3_client, bucket_name, item['Key'], path)
+        try:
+            entry = dict(scan_file(path), etag=item['ETag'], object=f'{index_prefix}/files/{plain_key(item["Key"])}')
+            if entry['variant'] is not None:
+                s3_client.upload_file(path, bucket_name, entry['object'], ExtraArgs={'ContentType': 'text/csv'})
+        finally:
+            os.remove(path)
+        return index_key, entry
+
+    stale = [index_key for index_key, item in objects.items() if files.get(index_key, {}).get('etag') != item['ETag']]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        files.update(executor.map(index_object, stale))
+
+    for index_key in [index_key for index_key in files if index_key.startswith(f'{bucket_name}/{prefix}') and index_key not in objects]:
+        removed = files.pop(index_key)
+        if removed.get('variant') is not None:
+            s3_client.delete_object(Bucket=bucket_name, Key=removed['object'])
+    s3_client.put_object(
+        Bucket=bucket_name,
+        Key=published_index_key(index_prefix),
+        Body=json.dumps(manifest).encode('utf-8'),
+        ContentType='application/json'
+    )
+    return len(stale)
+
+def load_jobs_from_history(s3_client, bucket_name, prefix, start_datetime, end_datetime, cache_dir=DEFAULT_CACHE_DIR, max_workers=DEFAULT_MAX_WORKERS):
+    # Rebuild a job set from previously generated reports. Overlapping reports repeat
+    # the same jobs; the copy from the latest report (by key) wins.
+    with sync_lock:
+        index = HistoryIndex(cache_dir)
+        index.sync(s3_client, bucket_name, prefix, max_workers)
+    start_utc = start_datetime.replace(tzinfo=start_datetime.tzinfo or timezone.utc)
+    end_utc = end_datetime.replace(tzinfo=end_datetime.tzinfo or timezone.utc)
+    return dedupe_jobs(index.query(start_utc, end_utc))
+
+def dedupe_jobs(jobs):
+    # Keep one copy per (resource, creation time); later copies replace earlier ones
+    unique = {}
+    for job in jobs:
+        unique[(job.get('ResourceArn', ''), job.get('CreationDate'))] = job
+    return list(unique.values())
@@ -0,0 +1,55 @@
+import os
+import hashlib
+from compression import compressed_key, upload_report
+
+# S3 user metadata holding the content hash of a report, and the report key a marker points at
+HASH_METADATA = 'content-sha256'
+REPORT_KEY_METADATA = 'report-key'
+
+class HashingFile:
+    # File wrapper that hashes everything written through it, so the digest is ready
+    # as soon as the serializer finishes without reading the file back
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data.encode('utf-8') if isinstance(data, str) else data)
+        return self.file.write(data)
+
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
+def previous_metadata(s3_client, bucket_name, key):
+    try:
+        return s3_client.head_object(Bucket=bucket_name, Key=key).get('Metadata', {})
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+
+def upload_if_changed(s3_client, filename, bucket_name, s3_key, content_hash, marker_key=None, compression=None):
+    # Skip the PUT when the previous object for this report has the same content hash.
+    # Timestamped report keys pass a stable marker_key that remembers the last upload.
+    # The hash is of the uncompressed report, so it does not depend on the compression.
+    # Returns (uploaded, key of the object holding this content).
+    if content_hash is None:
+        return True, upload_report(s3_client, filename, bucket_name, s3_key, compression)
+
+    previous = previous_metadata(s3_client, bucket_name, marker_key or compressed_key(s3_key, compression))
+    if previous and previous.get(HASH_METADATA) == content_hash:
+        return False, previous.get(REPORT_KEY_METADATA, compressed_key(s3_key, compression))
+
+    s3_key = upload_report(s3_client, filename, bucket_name, s3_key, compression, {'Metadata': {HASH_METADATA: content_hash}})
+    if marker_key:
+        s3_client.put_object(
+            Bucket=bucket_name,
+            Key=marker_key,
+            Body=b'',
+            Metadata={HASH_METADATA: content_hash, REPORT_KEY_METADATA: s3_key}
+        )
+    return True, s3_key
+
+def notify_when_unchanged():
+    # Set SKIP_UNCHANGED_NOTIFICATIONS=true to also skip the SNS publish on no-op runs
+    return os.environ.get('SKIP_UNCHANGED_NOTIFICATIONS', 'false').lower() != 'true'
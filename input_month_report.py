@@ -1,314 +1,17 @@
 import os
 import boto3
-import csv
 import json
 from datetime import datetime, timedelta
 import calendar
+from compression import compression_from_event, upload_report
+from concurrency_controller import CONTROLLED_CLIENT_CONFIG
+from fetch_engine import fetch_jobs
+import report_cache
+from row_serializer import REPORT_FIELDNAMES, write_rows
 
 def write_to_csv(jobs, csv_filename):
     # Write the backup job information to a CSV file
-    with open(csv_filename, 'w', newline='') as csvfile:
-        fieldnames = ['Date', 'Resource Type', 'Resource Name', 'Resource ID', 'Completion Date', 'Backup Start Time', 'Backup End Time', 'State', 'Status Message', 'Message Category', 'Backup Size (GiB)']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        
-        writer.writeheader()
-        for job in jobs:
-            backup_size_gib = job.get('BackupSizeInBytes', 0) / (1024 ** 3)  # Convert bytes to GiB
-            writer.writerow({
-                'Date': job.get('CreationDate', ''),
-                'Completion Date': job.get('CompletionDate', ''),
-                'Backup Start Time': job.get('StartBy', ''),
-                'Backup End Time': job.get('CompletionDate', ''),
-                'State': job.get('State', ''),
-                'Message Category': job.get('MessageCategory', ''),  # Modify as per your requirements
-                'Backup Size (GiB)': round(backup_size_gib, 2),  # Round to two decimal places
-                'Resource ID': job.get('ResourceArn', ''),
-                'Resource Type': job.get('ResourceType', ''),
-                'Resource Name': job.get('ResourceName', ''),
-                'Status Message': job.get('StatusMessage', '')
-            })
-
-def lambda_handler(event, context):
-    # Retrieve environment variables
-    s3_bucket_name = os.environ['S3_BUCKET_NAME']
-    sns_topic_arn = os.environ['SNS_TOPIC_ARN']
-    
-    # Extract month from input parameter
-    month = event.get('month')
-    if month is None:
-        return {
-            'statusCode': 400,
-            'body': json.dumps('Month parameter is missing.')
-        }
-
-    # Validate month input
-    try:
-        month = int(month)
-        if month < 1 or month > 12:
-            raise ValueError('Month should be between 1 and 12.')
-    except ValueError as e:
-        return {
-            'statusCode': 400,
-            'body': json.dumps(str(e))
-        }
-
-    # Calculate start and end dates for the specified month
-    today = datetime.utcnow()
-    start_datetime = datetime(today.year, month, 1)
-    end_datetime = datetime(today.year, month, calendar.monthrange(today.year, month)[1])
-
-    # Create a Boto3 AWS Backup client using the Lambda execution role's permissions
-    backup_client = boto3.client('backup')
-    s3_client = boto3.client('s3')
-    sns_client = boto3.client('sns')
-
-    # List all backup jobs within the specified date range, including failed and canceled jobs
-    jobs = []
-    response = backup_client.list_backup_jobs(
-        ByCreatedBefore=end_datetime,
-        ByCreatedAfter=start_datetime
-    )
-    jobs.extend(response.get('BackupJobs', []))
-
-    # Generate a timestamp for the report
-    timestamp = datetime.utcnow().strftime('%Y-%m-%d-%H-%M')
-
-    # Write the output to a CSV file with a timestamp
-    csv_filename = f'/tmp/backup_jobs_{timestamp}.csv'
-    write_to_csv(jobs, csv_filename)
-
-    # Upload the CSV file to the specified S3 bucket with a timestamp
-    s3_key = f'backup_report/backup_jobs_{timestamp}.csv'
-    s3_client.upload_file(csv_filename, s3_bucket_name, s3_key)
-
-    # Send SNS notification with the timestamped S3 key
-    sns_client.publish(
-        TopicArn=sns_topic_arn,
-        Subject=f'AWS Backup Job Report - Month {month}',
-        Message=f'The AWS Backup job report for Month {month} is available at: s3://{s3_bucket_name}/{s3_key}'
-    )
-
-    return {
-        'statusCode': 200,
-        'body': json.dumps('CSV file generated and SNS notification sent successfully!')
-    }
-
-if __name__ == "__main__":
-    # For testing locally
-    event = {'month': '4'}  # Example: Generate report for April (month = 4)
-    lambda_handler(event, {})
-
-
-#####################################################################################################
-
-import os
-import boto3
-import csv
-import json
-from datetime import datetime, timedelta
-import calendar
-
-def write_to_csv(jobs, csv_filename):
-    # Write the backup job information to a CSV file
-    with open(csv_filename, 'w', newline='') as csvfile:
-        fieldnames = ['Date', 'Resource Type', 'Resource Name', 'Resource ID', 'Completion Date', 'Backup Start Time', 'Backup End Time', 'State', 'Status Message', 'Message Category', 'Backup Size (GiB)']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        
-        writer.writeheader()
-        for job in jobs:
-            backup_size_gib = job.get('BackupSizeInBytes', 0) / (1024 ** 3)  # Convert bytes to GiB
-            writer.writerow({
-                'Date': job.get('CreationDate', ''),
-                'Completion Date': job.get('CompletionDate', ''),
-                'Backup Start Time': job.get('StartBy', ''),
-                'Backup End Time': job.get('CompletionDate', ''),
-                'State': job.get('State', ''),
-                'Message Category': job.get('MessageCategory', ''),  # Modify as per your requirements
-                'Backup Size (GiB)': round(backup_size_gib, 2),  # Round to two decimal places
-                'Resource ID': job.get('ResourceArn', ''),
-                'Resource Type': job.get('ResourceType', ''),
-                'Resource Name': job.get('ResourceName', ''),
-                'Status Message': job.get('StatusMessage', '')
-            })
-
-def lambda_handler(event, context):
-    # Retrieve environment variables
-    s3_bucket_name = os.environ['S3_BUCKET_NAME']
-    sns_topic_arn = os.environ['SNS_TOPIC_ARN']
-
-    # Extract month from input parameter if provided, otherwise use current month
-    month = event.get('month')
-    if month is None:
-        month = datetime.utcnow().month
-
-    # Calculate start and end dates for the specified month
-    today = datetime.utcnow()
-    start_datetime = datetime(today.year, month, 1)
-    end_datetime = datetime(today.year, month, calendar.monthrange(today.year, month)[1])
-
-    # Create a Boto3 AWS Backup client using the Lambda execution role's permissions
-    backup_client = boto3.client('backup')
-    s3_client = boto3.client('s3')
-    sns_client = boto3.client('sns')
-
-    # List all backup jobs within the specified date range, including failed and canceled jobs
-    jobs = []
-    response = backup_client.list_backup_jobs(
-        ByCreatedBefore=end_datetime,
-        ByCreatedAfter=start_datetime
-    )
-    jobs.extend(response.get('BackupJobs', []))
-
-    # Generate a timestamp for the report
-    timestamp = datetime.utcnow().strftime('%Y-%m-%d-%H-%M')
-
-    # Write the output to a CSV file with a timestamp
-    csv_filename = f'/tmp/backup_jobs_{timestamp}.csv'
-    write_to_csv(jobs, csv_filename)
-
-    # Upload the CSV file to the specified S3 bucket with a timestamp
-    s3_key = f'backup_report/backup_jobs_{timestamp}.csv'
-    s3_client.upload_file(csv_filename, s3_bucket_name, s3_key)
-
-    # Send SNS notification with the timestamped S3 key
-    sns_client.publish(
-        TopicArn=sns_topic_arn,
-        Subject=f'AWS Backup Job Report - Month {month}',
-        Message=f'The AWS Backup job report for Month {month} is available at: s3://{s3_bucket_name}/{s3_key}'
-    )
-
-    return {
-        'statusCode': 200,
-        'body': json.dumps('CSV file generated and SNS notification sent successfully!')
-    }
-
-if __name__ == "__main__":
-    # For testing locally
-    event = {'month': '4'}  # Example: Generate report for April (month = 4)
-    lambda_handler(event, {})
-
-
-
-
-========================================================================================================================
-
-import os
-import boto3
-import csv
-import json
-from datetime import datetime, timedelta
-import calendar
-
-def write_to_csv(jobs, csv_filename):
-    # Write the backup job information to a CSV file
-    with open(csv_filename, 'w', newline='') as csvfile:
-        fieldnames = ['Date', 'Resource Type', 'Resource Name', 'Resource ID', 'Completion Date', 'Backup Start Time', 'Backup End Time', 'State', 'Status Message', 'Message Category', 'Backup Size (GiB)']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        
-        writer.writeheader()
-        for job in jobs:
-            backup_size_gib = job.get('BackupSizeInBytes', 0) / (1024 ** 3)  # Convert bytes to GiB
-            writer.writerow({
-                'Date': job.get('CreationDate', ''),
-                'Completion Date': job.get('CompletionDate', ''),
-                'Backup Start Time': job.get('StartBy', ''),
-                'Backup End Time': job.get('CompletionDate', ''),
-                'State': job.get('State', ''),
-                'Message Category': job.get('MessageCategory', ''),  # Modify as per your requirements
-                'Backup Size (GiB)': round(backup_size_gib, 2),  # Round to two decimal places
-                'Resource ID': job.get('ResourceArn', ''),
-                'Resource Type': job.get('ResourceType', ''),
-                'Resource Name': job.get('ResourceName', ''),
-                'Status Message': job.get('StatusMessage', '')
-            })
-
-def lambda_handler(event, context):
-    # Retrieve environment variables
-    s3_bucket_name = os.environ['S3_BUCKET_NAME']
-    sns_topic_arn = os.environ['SNS_TOPIC_ARN']
-
-    # Extract month from input parameter if provided, otherwise use current month
-    month = event.get('month')
-    if month is None:
-        month = datetime.utcnow().month
-
-    # Calculate start and end dates for the specified month
-    today = datetime.utcnow()
-    start_datetime = datetime(today.year, month, 1)
-    end_datetime = datetime(today.year, month, calendar.monthrange(today.year, month)[1])
-
-    # Create a Boto3 AWS Backup client using the Lambda execution role's permissions
-    backup_client = boto3.client('backup')
-    s3_client = boto3.client('s3')
-    sns_client = boto3.client('sns')
-
-    # List all backup jobs within the specified date range, including failed and canceled jobs
-    jobs = []
-    response = backup_client.list_backup_jobs(
-        ByCreatedBefore=end_datetime,
-        ByCreatedAfter=start_datetime
-    )
-    jobs.extend(response.get('BackupJobs', []))
-
-    # Generate a timestamp for the report
-    timestamp = datetime.utcnow().strftime('%Y-%m-%d-%H-%M')
-
-    # Write the output to a CSV file with a timestamp
-    csv_filename = f'/tmp/backup_jobs_{timestamp}.csv'
-    write_to_csv(jobs, csv_filename)
-
-    # Upload the CSV file to the specified S3 bucket with a timestamp
-    s3_key = f'backup_report/backup_jobs_{timestamp}.csv'
-    s3_client.upload_file(csv_filename, s3_bucket_name, s3_key)
-
-    # Send SNS notification with the timestamped S3 key
-    sns_client.publish(
-        TopicArn=sns_topic_arn,
-        Subject=f'AWS Backup Job Report - Month {month}',
-        Message=f'The AWS Backup job report for Month {month} is available at: s3://{s3_bucket_name}/{s3_key}'
-    )
-
-    return {
-        'statusCode': 200,
-        'body': json.dumps('CSV file generated and SNS notification sent successfully!')
-    }
-
-if __name__ == "__main__":
-    # For testing locally
-    event = {'month': '4'}  # Example: Generate report for April (month = 4)
-    lambda_handler(event, {})
-
-
-########################################################################################
-import os
-import boto3
-import csv
-import json
-from datetime import datetime, timedelta
-import calendar
-
-def write_to_csv(jobs, csv_filename):
-    # Write the backup job information to a CSV file
-    with open(csv_filename, 'w', newline='') as csvfile:
-        fieldnames = ['Date', 'Resource Type', 'Resource Name', 'Resource ID', 'Completion Date', 'Backup Start Time', 'Backup End Time', 'State', 'Status Message', 'Message Category', 'Backup Size (GiB)']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        
-        writer.writeheader()
-        for job in jobs:
-            backup_size_gib = job.get('BackupSizeInBytes', 0) / (1024 ** 3)  # Convert bytes to GiB
-            writer.writerow({
-                'Date': job.get('CreationDate', ''),
-                'Completion Date': job.get('CompletionDate', ''),
-                'Backup Start Time': job.get('StartBy', ''),
-                'Backup End Time': job.get('CompletionDate', ''),
-                'State': job.get('State', ''),
-                'Message Category': job.get('MessageCategory', ''),  # Modify as per your requirements
-                'Backup Size (GiB)': round(backup_size_gib, 2),  # Round to two decimal places
-                'Resource ID': job.get('ResourceArn', ''),
-                'Resource Type': job.get('ResourceType', ''),
-                'Resource Name': job.get('ResourceName', ''),
-                'Status Message': job.get('StatusMessage', '')
-            })
+    return write_rows(jobs, csv_filename, REPORT_FIELDNAMES)
 
 def lambda_handler(event, context):
     # Retrieve environment variables
@@ -335,18 +38,26 @@ def lambda_handler(event, context):
     start_datetime = datetime(today.year, month, 1)
     end_datetime = datetime(today.year, month, calendar.monthrange(today.year, month)[1])
 
+    # A warm container that already built this report returns its S3 key without any API calls
+    filters = {key: value for key, value in event.items() if key != 'month'}
+    cache_key = report_cache.cache_key(report_cache.account_from_context(context), os.environ.get('AWS_REGION', ''), today.year, month, filters)
+    cached = report_cache.get(cache_key)
+    if cached is not None:
+        return {
+            'statusCode': 200,
+            'body': json.dumps(f'Report already generated for Month {month}: s3://{s3_bucket_name}/{cached}'),
+            's3_key': cached,
+            'cached': True
+        }
+
     # Create a Boto3 AWS Backup client using the Lambda execution role's permissions
-    backup_client = boto3.client('backup')
+    backup_client = boto3.client('backup', config=CONTROLLED_CLIENT_CONFIG)
     s3_client = boto3.client('s3')
     sns_client = boto3.client('sns')
 
-    # List all backup jobs within the specified date range, including failed and canceled jobs
-    jobs = []
-    response = backup_client.list_backup_jobs(
-        ByCreatedBefore=end_datetime,
-        ByCreatedAfter=start_datetime
-    )
-    jobs.extend(response.get('BackupJobs', []))
+    # List all backup jobs within the specified date range, including failed and canceled jobs;
+    # end_datetime is midnight of the last day, so the range runs one day past it
+    jobs = fetch_jobs(backup_client, start_datetime, end_datetime + timedelta(days=1))['backup']
 
     # Generate a timestamp for the report
     timestamp = datetime.utcnow().strftime('%Y-%m-%d-%H-%M')
@@ -357,7 +68,7 @@ def lambda_handler(event, context):
 
     # Upload the CSV file to the specified S3 bucket with a timestamp
     s3_key = f'backup_report/backup_jobs_{timestamp}.csv'
-    s3_client.upload_file(csv_filename, s3_bucket_name, s3_key)
+    s3_key = upload_report(s3_client, csv_filename, s3_bucket_name, s3_key, compression_from_event(event))
 
     # Send SNS notification with the timestamped S3 key
     sns_client.publish(
@@ -365,10 +76,13 @@ def lambda_handler(event, context):
         Subject=f'AWS Backup Job Report - Month {month}',
         Message=f'The AWS Backup job report for Month {month} is available at: s3://{s3_bucket_name}/{s3_key}'
     )
+    report_cache.put(cache_key, s3_key, report_cache.ttl_for_month(today.year, month, today))
 
     return {
         'statusCode': 200,
-        'body': json.dumps('CSV file generated and SNS notification sent successfully!')
+        'body': json.dumps('CSV file generated and SNS notification sent successfully!'),
+        's3_key': s3_key,
+        'cached': False
     }
 
 if __name__ == "__main__":
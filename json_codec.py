@@ -0,0 +1,31 @@
+import base64
+from datetime import datetime
+
+# JSON encoding for job records and API responses. Datetimes and bytes, which JSON cannot
+# hold, become single-key objects tagged with their type.
+def encode(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, (bytes, bytearray)):
+        return {'__bytes__': base64.b64encode(value).decode('ascii')}
+    if isinstance(value, dict):
+        return {key: encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode(item) for item in value]
+    return value
+
+# Tag -> function rebuilding the original value
+DECODERS = {
+    '__datetime__': datetime.fromisoformat,
+    '__bytes__': base64.b64decode,
+}
+
+def decode(value, decoders=DECODERS):
+    if isinstance(value, dict):
+        for tag, decoder in decoders.items():
+            if tag in value:
+                return decoder(value[tag])
+        return {key: decode(item, decoders) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode(item, decoders) for item in value]
+    return value
@@ -1,32 +1,24 @@
 
 import os
 import boto3
-import csv
 import json
 from datetime import datetime, timedelta
-
-def write_to_csv(jobs, csv_filename):
-    # Write the backup job information to a CSV file
-    with open(csv_filename, 'w', newline='') as csvfile:
-        fieldnames = ['Date', 'Resource Type', 'Resource Name', 'Resource ID', 'Completion Date', 'Backup Start Time', 'Backup End Time', 'State', 'Status Message', 'Message Category', 'Backup Size (GiB)']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        
-        writer.writeheader()
-        for job in jobs:
-            backup_size_gib = job.get('BackupSizeInBytes', 0) / (1024 ** 3)  # Convert bytes to GiB
-            writer.writerow({
-                'Date': job.get('CreationDate', ''),
-                'Completion Date': job.get('CompletionDate', ''),
-                'Backup Start Time': job.get('StartBy', ''),
-                'Backup End Time': job.get('CompletionDate', ''),
-                'State': job.get('State', ''),
-                'Message Category': job.get('MessageCategory', ''),  # Modify as per your requirements
-                'Backup Size (GiB)': round(backup_size_gib, 2),  # Round to two decimal places
-                'Resource ID': job.get('ResourceArn', ''),
-                'Resource Type': job.get('ResourceType', ''),
-                'Resource Name': job.get('ResourceName', ''),
-                'Status Message': job.get('StatusMessage', '')
-            })
+from functools import partial
+from compression import compression_from_event, upload_report
+from concurrency_controller import CONTROLLED_CLIENT_CONFIG, default_controller
+from external_sort import sort_fields_from_event, sort_jobs
+from fanout_writer import Sink, fan_out, format_sinks, requested_formats
+from fetch_engine import fetch_jobs, requested_job_types, write_section_to_csv
+from idempotent_upload import notify_when_unchanged, upload_if_changed
+from resource_stats import anomaly_detection_enabled, anomaly_section, update_state
+from rollups import write_daily_rollups
+from row_serializer import REPORT_FIELDNAMES, write_rows
+from vault_sharding import fetch_jobs_by_vault, write_to_csv_with_inventory
+from xlsx_writer import write_to_xlsx
+
+def write_to_csv(jobs, csv_filename, extra_fieldnames=()):
+    # Write the backup job information to a CSV file, plus e.g. the Anomaly column
+    return write_rows(jobs, csv_filename, REPORT_FIELDNAMES + list(extra_fieldnames))
 
 def lambda_handler(event, context):
     # Retrieve environment variables
@@ -34,7 +26,7 @@ def lambda_handler(event, context):
     sns_topic_arn = os.environ['SNS_TOPIC_ARN']
 
     # Create a Boto3 AWS Backup client using the Lambda execution role's permissions
-    backup_client = boto3.client('backup')
+    backup_client = boto3.client('backup', config=CONTROLLED_CLIENT_CONFIG)
     s3_client = boto3.client('s3')
     sns_client = boto3.client('sns')
 
@@ -42,37 +34,87 @@ def lambda_handler(event, context):
     end_datetime = datetime.utcnow()
     start_datetime = end_datetime - timedelta(days=30)
 
-    # List all backup jobs within the specified date range, including failed and canceled jobs
-    jobs = []
-    while start_datetime <= end_datetime:
-        response = backup_client.list_backup_jobs(
-            ByCreatedBefore=end_datetime,
-            ByCreatedAfter=start_datetime
-        )
-        jobs.extend(response.get('BackupJobs', []))
-        end_datetime -= timedelta(days=1)
+    # List all backup jobs within the specified date range, including failed and canceled jobs,
+    # plus copy and restore jobs when requested, over the same daily windows.
+    # With 'shard_by': 'vault', backup jobs are fetched per vault and joined with the
+    # vault's recovery point inventory instead.
+    job_types = requested_job_types(event)
+    shard_by_vault = event.get('shard_by') == 'vault'
+    if shard_by_vault:
+        sections = fetch_jobs(backup_client, start_datetime, end_datetime, job_types[1:])
+        sections['backup'] = fetch_jobs_by_vault(backup_client, start_datetime, end_datetime)
+    else:
+        sections = fetch_jobs(backup_client, start_datetime, end_datetime, job_types)
+    jobs = sections['backup']
+    print(f'API concurrency and throttles: {default_controller.stats()}')
+
+    # Optionally update the per-resource size and duration statistics, which also fills
+    # each job's Anomaly column
+    anomalies = []
+    extra_fieldnames = []
+    if anomaly_detection_enabled(event):
+        anomalies = update_state(s3_client, s3_bucket_name, jobs)
+        extra_fieldnames = ['Anomaly']
 
     # Generate a timestamp for the report
     timestamp = datetime.utcnow().strftime('%Y-%m-%d-%H-%M')
 
-    # Write the output to a CSV file with a timestamp
-    csv_filename = f'/tmp/backup_jobs_{timestamp}.csv'
-    write_to_csv(jobs, csv_filename)
-
-    # Upload the CSV file to the specified S3 bucket with a timestamp
-    s3_key = f'backup_report/backup_jobs_{timestamp}.csv'
-    s3_client.upload_file(csv_filename, s3_bucket_name, s3_key)
+    # Write the output to a CSV file (or an XLSX workbook when requested) with a timestamp
+    report_format = event.get('format', 'csv')
+    # Reports are gzip-compressed on upload unless 'compression' says otherwise ('zstd' or 'none')
+    compression = compression_from_event(event)
+    csv_filename = f'/tmp/backup_jobs_{timestamp}.{report_format}'
+    # Optionally sort the rows (e.g. 'sort_by': 'CreationDate,ResourceArn'); the jobs are
+    # already in memory for the rollups, so they are sorted in memory
+    sort_fields = sort_fields_from_event(event)
+    report_jobs = sort_jobs(jobs, sort_fields) if sort_fields else jobs
+    if report_format == 'xlsx':
+        write_report = write_to_xlsx
+    elif shard_by_vault:
+        write_report = partial(write_to_csv_with_inventory, extra_fieldnames=extra_fieldnames)
+    else:
+        write_report = partial(write_to_csv, extra_fieldnames=extra_fieldnames)
+
+    # Upload the report file to the specified S3 bucket with a timestamp, unless the
+    # last uploaded report has the same content
+    s3_key = f'backup_report/backup_jobs_{timestamp}.{report_format}'
+    def upload_if_new(filename, content_hash):
+        return upload_if_changed(s3_client, filename, s3_bucket_name, s3_key, content_hash, marker_key=f'backup_report/latest_backup_jobs.{report_format}.marker', compression=compression)
+
+    # Write the report and any extra formats (e.g. 'extra_formats': ['jsonl', 'parquet', 'summary'])
+    # in a single pass over the rows; each format writes and uploads on its own thread
+    sinks = [Sink('report', write_report, csv_filename, upload_if_new)]
+    sinks += format_sinks(requested_formats(event), s3_client, s3_bucket_name, f'/tmp/backup_jobs_{timestamp}', f'backup_report/backup_jobs_{timestamp}', compression)
+    results = fan_out(report_jobs, sinks)
+    uploaded, s3_key = results.pop('report')
+    report_locations = [f's3://{s3_bucket_name}/{s3_key}'] + list(results.values())
+
+    # Write the per-day aggregate rollups next to the detail report
+    if uploaded:
+        write_daily_rollups(s3_client, s3_bucket_name, jobs, start_datetime, end_datetime)
+
+    # Write and upload the copy and restore job sections, if requested
+    for job_type, section_jobs in sections.items():
+        if job_type == 'backup':
+            continue
+        section_filename = f'/tmp/{job_type}_jobs_{timestamp}.csv'
+        write_section_to_csv(job_type, section_jobs, section_filename)
+        section_key = f'backup_report/{job_type}_jobs_{timestamp}.csv'
+        section_key = upload_report(s3_client, section_filename, s3_bucket_name, section_key, compression)
+        report_locations.append(f's3://{s3_bucket_name}/{section_key}')
 
     # Send SNS notification with the timestamped S3 key
-    sns_client.publish(
-        TopicArn=sns_topic_arn,
-        Subject='AWS Backup Job Report',
-        Message=f'The AWS Backup job report for the last 1 month is available at: s3://{s3_bucket_name}/{s3_key}'
-    )
+    if uploaded or notify_when_unchanged():
+        sns_client.publish(
+            TopicArn=sns_topic_arn,
+            Subject='AWS Backup Job Report',
+            Message='The AWS Backup job report for the last 1 month is available at: ' + ', '.join(report_locations) + anomaly_section(anomalies)
+        )
 
     return {
         'statusCode': 200,
-        'body': json.dumps('CSV file generated and SNS notification sent successfully!')
+        'body': json.dumps('CSV file generated and SNS notification sent successfully!' if uploaded else 'Report unchanged since the last run; upload skipped.'),
+        'noop': not uploaded
     }
 
 if __name__ == "__main__":
@@ -1,40 +1,15 @@
 import os
 import boto3
-import csv
 import json
 from datetime import datetime, timedelta
-
-def extract_instance_id(resource_id):
-    # Extract Instance ID from the Resource ID (assuming the Resource ID follows the format: arn:aws:ec2:region:account-id:instance/instance-id)
-    parts = resource_id.split('/')
-    return parts[-1] if len(parts) == 2 else ''
+from compression import compression_from_event, upload_report
+from concurrency_controller import CONTROLLED_CLIENT_CONFIG
+from fetch_engine import fetch_jobs
+from row_serializer import INSTANCE_ID_FIELDNAMES, write_rows
 
 def write_to_csv(jobs, csv_filename):
     # Write the backup job information to a CSV file
-    with open(csv_filename, 'w', newline='') as csvfile:
-        fieldnames = ['Date', 'Resource Type', 'Resource Name', 'Resource ID', 'Instance ID', 'Completion Date', 'Backup Start Time', 'Backup End Time', 'State', 'Status Message', 'Message Category', 'Backup Size (GiB)']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        
-        writer.writeheader()
-        for job in jobs:
-            backup_size_gib = job.get('BackupSizeInBytes', 0) / (1024 ** 3)  # Convert bytes to GiB
-            resource_id = job.get('ResourceArn', '')
-            instance_id = extract_instance_id(resource_id)
-
-            writer.writerow({
-                'Date': job.get('CreationDate', ''),
-                'Completion Date': job.get('CompletionDate', ''),
-                'Backup Start Time': job.get('StartBy', ''),
-                'Backup End Time': job.get('CompletionDate', ''),
-                'State': job.get('State', ''),
-                'Message Category': job.get('MessageCategory', ''),  # Modify as per your requirements
-                'Backup Size (GiB)': round(backup_size_gib, 2),  # Round to two decimal places
-                'Resource ID': resource_id,
-                'Instance ID': instance_id,
-                'Resource Type': job.get('ResourceType', ''),
-                'Resource Name': job.get('ResourceName', ''),
-                'Status Message': job.get('StatusMessage', '')
-            })
+    return write_rows(jobs, csv_filename, INSTANCE_ID_FIELDNAMES)
 
 def lambda_handler(event, context):
     # Retrieve environment variables
@@ -42,7 +17,7 @@ def lambda_handler(event, context):
     sns_topic_arn = os.environ['SNS_TOPIC_ARN']
 
     # Create a Boto3 AWS Backup client using the Lambda execution role's permissions
-    backup_client = boto3.client('backup')
+    backup_client = boto3.client('backup', config=CONTROLLED_CLIENT_CONFIG)
     s3_client = boto3.client('s3')
     sns_client = boto3.client('sns')
 
@@ -61,14 +36,7 @@ def lambda_handler(event, context):
         end_datetime = datetime.utcnow()
 
     # List all backup jobs within the specified date range, including failed and canceled jobs
-    jobs = []
-    while start_datetime <= end_datetime:
-        response = backup_client.list_backup_jobs(
-            ByCreatedBefore=end_datetime,
-            ByCreatedAfter=start_datetime
-        )
-        jobs.extend(response.get('BackupJobs', []))
-        end_datetime -= timedelta(days=1)
+    jobs = fetch_jobs(backup_client, start_datetime, end_datetime)['backup']
 
     # Generate a timestamp for the report
     timestamp = datetime.utcnow().strftime('%Y-%m-%d-%H-%M')
@@ -79,7 +47,7 @@ def lambda_handler(event, context):
 
     # Upload the CSV file to the specified S3 bucket with a timestamp
     s3_key = f'backup_report/backup_jobs_{timestamp}.csv'
-    s3_client.upload_file(csv_filename, s3_bucket_name, s3_key)
+    s3_key = upload_report(s3_client, csv_filename, s3_bucket_name, s3_key, compression_from_event(event))
 
     # Send SNS notification with the timestamped S3 key
     sns_client.publish(
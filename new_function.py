@@ -1,31 +1,15 @@
 import os
 import boto3
-import csv
 import json
 from datetime import datetime, timedelta
+from compression import compression_from_event, upload_report
+from concurrency_controller import CONTROLLED_CLIENT_CONFIG
+from fetch_engine import fetch_jobs
+from row_serializer import REPORT_FIELDNAMES, write_rows
 
 def write_to_csv(jobs, csv_filename):
     # Write the backup job information to a CSV file
-    with open(csv_filename, 'w', newline='') as csvfile:
-        fieldnames = ['Date', 'Resource Type', 'Resource Name', 'Resource ID', 'Completion Date', 'Backup Start Time', 'Backup End Time', 'State', 'Status Message', 'Message Category', 'Backup Size (GiB)']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        
-        writer.writeheader()
-        for job in jobs:
-            backup_size_gib = job.get('BackupSizeInBytes', 0) / (1024 ** 3)  # Convert bytes to GiB
-            writer.writerow({
-                'Date': job.get('CreationDate', ''),
-                'Completion Date': job.get('CompletionDate', ''),
-                'Backup Start Time': job.get('StartBy', ''),
-                'Backup End Time': job.get('CompletionDate', ''),
-                'State': job.get('State', ''),
-                'Message Category': job.get('MessageCategory', ''),  # Modify as per your requirements
-                'Backup Size (GiB)': round(backup_size_gib, 2),  # Round to two decimal places
-                'Resource ID': job.get('ResourceArn', ''),
-                'Resource Type': job.get('ResourceType', ''),
-                'Resource Name': job.get('ResourceName', ''),
-                'Status Message': job.get('StatusMessage', '')
-            })
+    return write_rows(jobs, csv_filename, REPORT_FIELDNAMES)
 
 def get_month_dates(year, month):
     # Get the first day and last day of the specified month and year
@@ -44,7 +28,7 @@ def lambda_handler(event, context):
     input_year = event.get('year')
 
     # Create a Boto3 AWS Backup client using the Lambda execution role's permissions
-    backup_client = boto3.client('backup')
+    backup_client = boto3.client('backup', config=CONTROLLED_CLIENT_CONFIG)
     s3_client = boto3.client('s3')
     sns_client = boto3.client('sns')
 
@@ -52,14 +36,8 @@ def lambda_handler(event, context):
     start_datetime, end_datetime = get_month_dates(int(input_year), int(input_month))  # Convert input to integers
 
     # List all backup jobs within the specified date range, including failed and canceled jobs
-    jobs = []
-    while start_datetime <= end_datetime:
-        response = backup_client.list_backup_jobs(
-            ByCreatedBefore=end_datetime + timedelta(days=1),  # Add 1 day to end_datetime to include the entire last day
-            ByCreatedAfter=start_datetime
-        )
-        jobs.extend(response.get('BackupJobs', []))
-        start_datetime += timedelta(days=1)
+    # Add 1 day to end_datetime to include the entire last day
+    jobs = fetch_jobs(backup_client, start_datetime, end_datetime + timedelta(days=1))['backup']
 
     # Generate a timestamp for the report
     timestamp = datetime.utcnow().strftime('%Y-%m-%d-%H-%M')
@@ -73,7 +51,7 @@ def lambda_handler(event, context):
 
     # Upload the CSV file to the specified folder in the S3 bucket
     s3_key = f'backup_report/{folder_name}/backup_jobs_{timestamp}.csv'
-    s3_client.upload_file(csv_filename, s3_bucket_name, s3_key)
+    s3_key = upload_report(s3_client, csv_filename, s3_bucket_name, s3_key, compression_from_event(event))
 
     # Send SNS notification with the timestamped S3 key
     sns_client.publish(
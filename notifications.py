@@ -0,0 +1,94 @@
+import json
+import threading
+import uuid
+
+# SNS PublishBatch limits: 10 entries and 256 KB per request. Digest entries are kept
+# well under a tenth of that so a full batch always fits.
+MAX_BATCH_ENTRIES = 10
+MAX_ENTRY_BYTES = 24 * 1024
+FAILED_STATES = {'FAILED', 'ABORTED', 'EXPIRED', 'PARTIAL'}
+GIB = 1024 ** 3
+
+def report_metrics(jobs):
+    # Key numbers shown next to each report in the digest
+    return {
+        'jobs': len(jobs),
+        'failed': sum(1 for job in jobs if job.get('State', '') in FAILED_STATES),
+        'size_gib': round(sum(job.get('BackupSizeInBytes') or 0 for job in jobs) / GIB, 2),
+    }
+
+def report_line(report):
+    scope = ' '.join(str(report[key]) for key in ('account_id', 'region', 'period') if report.get(key))
+    return (f"{report['location']}: {report.get('jobs', 0)} jobs, {report.get('failed', 0)} failed, "
+            f"{report.get('size_gib', 0)} GiB" + (f' ({scope})' if scope else ''))
+
+class ReportDigest:
+    # Collects report results during a run (from any thread) and publishes them as digest
+    # messages in PublishBatch calls, instead of one publish per report
+    def __init__(self, sns_client, topic_arn, subject='AWS Backup Job Report'):
+        self.sns_client = sns_client
+        self.topic_arn = topic_arn
+        self.subject = subject
+        self.reports = []
+        self.lock = threading.Lock()
+
+    def add(self, location, account_id='', region='', period='', **metrics):
+        with self.lock:
+            self.reports.append({'location': location, 'account_id': account_id, 'region': region, 'period': period, **metrics})
+
+    def digest_parts(self):
+        # Split the report lines into parts that each fit in one batch entry
+        parts = [[]]
+        size = 0
+        for report in self.reports:
+            # The text line plus the record twice (sqs and lambda), each escaped inside the message
+            line_size = len(json.dumps(report_line(report))) + 2 * len(json.dumps(json.dumps(report))) + 4
+            if parts[-1] and size + line_size > MAX_ENTRY_BYTES - 1024:
+                parts.append([])
+                size = 0
+            parts[-1].append(report)
+            size += line_size
+        return parts
+
+    def entries(self):
+        # One entry per digest part. As in the CloudTrail handler, the message is a JSON
+        # document with MessageStructure='json': email subscribers get the text digest
+        # under 'default', and SQS/Lambda subscribers get the report records as JSON.
+        parts = self.digest_parts()
+        total_jobs = sum(report.get('jobs', 0) for report in self.reports)
+        total_failed = sum(report.get('failed', 0) for report in self.reports)
+        entries = []
+        for number, reports in enumerate(parts, 1):
+            header = f'{len(self.reports)} AWS Backup job reports ({total_jobs} jobs, {total_failed} failed)'
+            if len(parts) > 1:
+                header += f', part {number} of {len(parts)}'
+            text = header + ':\n' + '\n'.join(report_line(report) for report in reports)
+            records = json.dumps({'reports': reports, 'part': number, 'parts': len(parts)})
+            entry = {
+                'Id': f'digest-{number}',
+                'Subject': (self.subject if len(parts) == 1 else f'{self.subject} ({number}/{len(parts)})')[:100],
+                'Message': json.dumps({'default': text, 'sqs': records, 'lambda': records}),
+                'MessageStructure': 'json',
+                'MessageAttributes': {'Reports': {'DataType': 'Number', 'StringValue': str(len(reports))}},
+            }
+            if self.topic_arn.endswith('.fifo'):
+                entry['MessageGroupId'] = 'backup-reports'
+                entry['MessageDeduplicationId'] = str(uuid.uuid4())
+            entries.append(entry)
+        return entries
+
+    def publish(self):
+        # Send the digest in batches of up to 10 entries; returns the failed entries
+        if not self.reports:
+            return []
+        entries = self.entries()
+        failed = []
+        for start in range(0, len(entries), MAX_BATCH_ENTRIES):
+            response = self.sns_client.publish_batch(
+                TopicArn=self.topic_arn,
+                PublishBatchRequestEntries=entries[start:start + MAX_BATCH_ENTRIES]
+            )
+            failed.extend(response.get('Failed', []))
+        for failure in failed:
+            print(f"Digest entry {failure.get('Id')} was not published: {failure.get('Code')} {failure.get('Message', '')}")
+        return failed
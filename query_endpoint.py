@@ -0,0 +1,207 @@
+import os
+import sys
+import json
+import time
+import base64
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+import boto3
+from fanout_writer import to_json_value
+from history_loader import DEFAULT_CACHE_DIR, HistoryIndex, S3HistoryIndex, dedupe_jobs, parse_time, publish_index, read_published_index
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+# Re-check the published index (a conditional GET of index.json) at most this often
+SYNC_INTERVAL_SECONDS = int(os.environ.get('QUERY_SYNC_SECONDS', '300'))
+# Bounds of the in-memory response cache
+CACHE_MAX_ENTRIES = int(os.environ.get('QUERY_CACHE_MAX_ENTRIES', '256'))
+CACHE_MAX_BYTES = int(os.environ.get('QUERY_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+FILTER_KEYS = {'resource': 'ResourceArn', 'state': 'State', 'resource_type': 'ResourceType'}
+
+class QueryCache:
+    # LRU of response bodies, bounded by entry count and total body size
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, etag, body):
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key)[1])
+            self.entries[key] = (etag, body)
+            self.size += len(body)
+            while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+                self.size -= len(self.entries.popitem(last=False)[1][1])
+
+_cache = QueryCache()
+_index_state = {'index': None, 'synced_at': 0.0, 'version': ''}
+_index_lock = threading.Lock()
+
+def current_index(s3_client, bucket_name, cache_dir=DEFAULT_CACHE_DIR):
+    # The job index and its version. With a bucket, this is the index published by
+    # refresh_handler, re-checked with a conditional GET at most every SYNC_INTERVAL_SECONDS
+    # and queried in place; the request path never lists or downloads reports. The version
+    # (the index ETag) changes whenever a report is added, replaced or removed, which
+    # retires cached responses built from the older index. Without a bucket (local testing)
+    # the index already in cache_dir is used.
+    with _index_lock:
+        if _index_state['index'] is None or time.monotonic() - _index_state['synced_at'] >= SYNC_INTERVAL_SECONDS:
+            if bucket_name:
+                manifest, etag = read_published_index(s3_client, bucket_name, _index_state['version'] or None)
+                if manifest is not None:
+                    _index_state.update(index=S3HistoryIndex(s3_client, bucket_name, manifest), version=etag or '')
+            else:
+                index = HistoryIndex(cache_dir)
+                files = sorted((key, entry.get('etag', '')) for key, entry in index.files.items())
+                _index_state.update(index=index, version=hashlib.sha256(json.dumps(files).encode('utf-8')).hexdigest())
+            _index_state['synced_at'] = time.monotonic()
+        return _index_state['index'], _index_state['version']
+
+def parse_bound(value, default):
+    # YYYY-MM-DD or an ISO timestamp, as UTC
+    if not value:
+        return default
+    parsed = parse_time(value)
+    if parsed is None:
+        raise ValueError(f'Invalid date: {value}')
+    return parsed
+
+def parse_query(params):
+    # Normalized query: time range (default: the current month), filters, page size and cursor
+    now = datetime.now(timezone.utc)
+    start = parse_bound(params.get('from'), now.replace(day=1, hour=0, minute=0, second=0, microsecond=0))
+    # The default end is the end of today, so repeated queries keep the same ETag all day
+    end = parse_bound(params.get('to'), now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1))
+    if params.get('to') and len(params['to']) == 10:
+        end += timedelta(days=1)  # A date bound includes that whole day
+    limit = min(max(int(params.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    offset = 0
+    if params.get('cursor'):
+        offset = int(json.loads(base64.urlsafe_b64decode(params['cursor'].encode('ascii')))['offset'])
+    filters = {FILTER_KEYS[name]: params[name] for name in sorted(FILTER_KEYS) if params.get(name)}
+    return start, end, filters, limit, offset
+
+def matches(job, filters):
+    # Exact match on state and resource type; resource matches any part of the ARN
+    for key, value in filters.items():
+        field = str(job.get(key, ''))
+        if (value not in field) if key == 'ResourceArn' else (field != value):
+            return False
+    return True
+
+def run_query(index, start, end, filters, limit, offset):
+    jobs = dedupe_jobs(index.query(start, end, lambda job: matches(job, filters)))
+    jobs.sort(key=lambda job: (job['CreationDate'], job.get('ResourceArn', '')))
+    page = jobs[offset:offset + limit]
+    next_offset = offset + len(page)
+    return {
+        'from': start,
+        'to': end,
+        'filters': filters,
+        'total': len(jobs),
+        'count': len(page),
+        'jobs': page,
+        'next_cursor': base64.urlsafe_b64encode(json.dumps({'offset': next_offset}).encode('ascii')).decode('ascii') if next_offset < len(jobs) else None,
+    }
+
+def etag_matches(if_none_match, etag):
+    # If-None-Match uses weak comparison (RFC 7232): W/"<hash>" from a proxy or browser
+    # matches the strong tag; '*' matches any representation
+    tags = [tag.strip() for tag in (if_none_match or '').split(',')]
+    return '*' in tags or etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+def handle_query(method, params, headers, s3_client=None):
+    # Shared by the Lambda Function URL handler and the local HTTP server.
+    # Returns (status, headers, body bytes).
+    if method not in ('GET', 'HEAD'):
+        return 405, {'Allow': 'GET, HEAD'}, b''
+    try:
+        start, end, filters, limit, offset = parse_query(params)
+    except (ValueError, KeyError) as e:
+        return 400, {'Content-Type': 'application/json'}, json.dumps({'error': str(e)}).encode('utf-8')
+
+    index, version = current_index(s3_client, os.environ.get('S3_BUCKET_NAME'))
+    cache_key = (version, start, end, tuple(filters.items()), limit, offset)
+    cached = _cache.get(cache_key)
+    if cached is None:
+        body = json.dumps(run_query(index, start, end, filters, limit, offset), default=to_json_value, separators=(',', ':')).encode('utf-8')
+        # Strong ETag: the hash of the exact response bytes
+        cached = (f'"{hashlib.sha256(body).hexdigest()}"', body)
+        _cache.put(cache_key, *cached)
+    etag, body = cached
+
+    response_headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if etag_matches(headers.get('if-none-match'), etag):
+        return 304, response_headers, b''
+    # HEAD answers with the headers of the GET response, including its length
+    response_headers['Content-Type'] = 'application/json'
+    response_headers['Content-Length'] = str(len(body))
+    return 200, response_headers, b'' if method == 'HEAD' else body
+
+def lambda_handler(event, context):
+    # Lambda Function URL (payload format 2.0) entry point, e.g.
+    # GET /?resource=i-0123&state=FAILED&from=2024-04-01&limit=50
+    method = event.get('requestContext', {}).get('http', {}).get('method', 'GET')
+    headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+    status, response_headers, body = handle_query(method, event.get('queryStringParameters') or {}, headers, boto3.client('s3'))
+    return {
+        'statusCode': status,
+        'headers': response_headers,
+        'body': body.decode('utf-8'),
+    }
+
+def refresh_handler(event, context):
+    # Scheduled entry point (e.g. an EventBridge rule every 5 minutes): index new or changed
+    # reports under QUERY_REPORT_PREFIX and publish the index that lambda_handler reads
+    refreshed = publish_index(boto3.client('s3'), os.environ['S3_BUCKET_NAME'], os.environ.get('QUERY_REPORT_PREFIX', 'backup_report/'))
+    return {'statusCode': 200, 'body': json.dumps(f'{refreshed} reports indexed')}
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    # Local HTTP server for testing the endpoint against a local index
+    def respond(self):
+        params = dict(parse_qsl(urlsplit(self.path).query))
+        headers = {name.lower(): value for name, value in self.headers.items()}
+        status, response_headers, body = handle_query(self.command, params, headers, self.server.s3_client)
+        self.send_response(status)
+        for name, value in response_headers.items():
+            self.send_header(name, value)
+        if 'Content-Length' not in response_headers:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_HEAD = respond
+
+if __name__ == "__main__":
+    # For testing locally: python query_endpoint.py --port 8080 [--bucket my-report-bucket [--refresh]]
+    # Without --bucket, queries run against the index already in HISTORY_CACHE_DIR
+    parser = argparse.ArgumentParser(description='Serve report queries over HTTP.')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--bucket', default=os.environ.get('S3_BUCKET_NAME'))
+    parser.add_argument('--refresh', action='store_true', help='Publish the index of the bucket before serving')
+    args = parser.parse_args(sys.argv[1:])
+    if args.bucket:
+        os.environ['S3_BUCKET_NAME'] = args.bucket
+    else:
+        os.environ.pop('S3_BUCKET_NAME', None)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), QueryRequestHandler)
+    server.s3_client = boto3.client('s3') if args.bucket else None
+    if args.bucket and args.refresh:
+        print(f"{publish_index(server.s3_client, args.bucket, os.environ.get('QUERY_REPORT_PREFIX', 'backup_report/'))} reports indexed")
+    print(f'Serving report queries on http://127.0.0.1:{args.port}/')
+    server.serve_forever()
@@ -0,0 +1,54 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+# Module-level, so finished reports survive between invocations on a warm container
+MAX_ENTRIES = int(os.environ.get('REPORT_CACHE_MAX_ENTRIES', '64'))
+OPEN_MONTH_TTL_SECONDS = int(os.environ.get('REPORT_CACHE_OPEN_MONTH_TTL', '300'))
+CLOSED_MONTH_TTL_SECONDS = int(os.environ.get('REPORT_CACHE_CLOSED_MONTH_TTL', '86400'))
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+
+def cache_key(account_id, region, year, month, filters):
+    # Filters are any other event parameters; serialize them so equal requests share a key
+    return (account_id, region, year, month, json.dumps(filters, sort_keys=True, default=str))
+
+def ttl_for_month(year, month, now=None):
+    # A closed month can no longer change, so it is cached much longer than the current one
+    now = now or datetime.utcnow()
+    month_end = datetime(year + month // 12, month % 12 + 1, 1)
+    return CLOSED_MONTH_TTL_SECONDS if now >= month_end else OPEN_MONTH_TTL_SECONDS
+
+def get(key):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            del _entries[key]
+            return None
+        _entries.move_to_end(key)
+        return value
+
+def put(key, value, ttl_seconds):
+    # Evict least recently used entries beyond MAX_ENTRIES
+    with _lock:
+        _entries[key] = (time.monotonic() + ttl_seconds, value)
+        _entries.move_to_end(key)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+
+def clear():
+    with _lock:
+        _entries.clear()
+
+def account_from_context(context):
+    # The account is part of the function ARN, so no STS call is needed
+    function_arn = getattr(context, 'invoked_function_arn', '') or ''
+    parts = function_arn.split(':')
+    return parts[4] if len(parts) > 4 else ''
@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import argparse
+import calendar
+import boto3
+import aws_cassette
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from audit_manager_source import load_jobs_from_audit_reports
+from compression import compression_from_event, upload_report
+from concurrency_controller import CONTROLLED_CLIENT_CONFIG
+from event_ingestion import load_jobs
+from fetch_engine import fetch_jobs, paginate
+from history_loader import load_jobs_from_history
+from notifications import ReportDigest, report_metrics
+from row_serializer import REPORT_FIELDNAMES, write_rows
+from xlsx_writer import write_to_xlsx
+
+def parse_month(value):
+    # Accept 'YYYY-MM' or a bare month number for the current year
+    if '-' in value:
+        year, month = value.split('-')
+        return int(year), int(month)
+    return datetime.utcnow().year, int(value)
+
+def month_ranges(start_datetime, end_datetime):
+    # Split the range on calendar month boundaries so each month becomes its own report
+    ranges = []
+    range_start = start_datetime
+    while range_start < end_datetime:
+        next_month = datetime(range_start.year + range_start.month // 12, range_start.month % 12 + 1, 1)
+        range_end = min(next_month, end_datetime)
+        ranges.append((range_start, range_end))
+        range_start = range_end
+    return ranges
+
+def resolve_range(args):
+    # --month wins over --from/--to; the default is the last 30 days like lambda_function.py
+    if args.month:
+        year, month = parse_month(args.month)
+        start_datetime = datetime(year, month, 1)
+        return start_datetime, start_datetime + timedelta(days=calendar.monthrange(year, month)[1])
+    end_datetime = datetime.strptime(args.to_date, '%Y-%m-%d') + timedelta(days=1) if args.to_date else datetime.utcnow()
+    start_datetime = datetime.strptime(args.from_date, '%Y-%m-%d') if args.from_date else end_datetime - timedelta(days=30)
+    return start_datetime, end_datetime
+
+def account_session(sts_client, account_id, role_name, region):
+    # Assume the reporting role in each member account; no account means the current credentials
+    if not account_id:
+        return aws_cassette.attach(boto3.session.Session(region_name=region))
+    credentials = sts_client.assume_role(
+        RoleArn=f'arn:aws:iam::{account_id}:role/{role_name}',
+        RoleSessionName='backup-report-cli'
+    )['Credentials']
+    return aws_cassette.attach(boto3.session.Session(
+        aws_access_key_id=credentials['AccessKeyId'],
+        aws_secret_access_key=credentials['SecretAccessKey'],
+        aws_session_token=credentials['SessionToken'],
+        region_name=region
+    ))
+
+def cloudtrail_event_to_job(cloudtrail_event):
+    # Map a BackupJobCompleted CloudTrail event onto the list_backup_jobs record layout
+    service_event_details = json.loads(cloudtrail_event.get('CloudTrailEvent', '{}')).get('serviceEventDetails', {})
+    return {
+        'BackupJobId': service_event_details.get('backupJobId', ''),
+        'CreationDate': cloudtrail_event.get('EventTime', ''),
+        'CompletionDate': cloudtrail_event.get('EventTime', ''),
+        'State': service_event_details.get('state', ''),
+        'ResourceArn': service_event_details.get('resourceArn', ''),
+        'ResourceType': service_event_details.get('resourceType', ''),
+        'BackupSizeInBytes': service_event_details.get('backupSizeInBytes', 0),
+    }
+
+def fetch_source(session, s3_client, args, account_id, start_datetime, end_datetime, workers):
+    # s3_client reads the report buckets with the current credentials; account_id keys the
+    # API limiters, so accounts with separate quotas do not throttle each other
+    if args.source == 'cloudtrail':
+        events = paginate(
+            session.client('cloudtrail', config=CONTROLLED_CLIENT_CONFIG),
+            'lookup_events',
+            'Events',
+            account_id=account_id,
+            LookupAttributes=[
+                {'AttributeKey': 'EventName', 'AttributeValue': 'BackupJobCompleted'}
+            ],
+            StartTime=start_datetime,
+            EndTime=end_datetime
+        )
+        return [cloudtrail_event_to_job(cloudtrail_event) for cloudtrail_event in events]
+    if args.source == 'audit-manager':
+        account_id = account_id or session.client('sts').get_caller_identity()['Account']
+        return load_jobs_from_audit_reports(
+            s3_client, args.audit_bucket, args.audit_prefix, account_id, session.region_name,
+            args.audit_report_plan, start_datetime, end_datetime, workers
+        )
+    if args.source == 'history':
+        return load_jobs_from_history(s3_client, args.history_bucket, args.history_prefix, start_datetime, end_datetime, max_workers=workers)
+    if args.source == 's3-archive':
+        return load_jobs(session.client('s3'), args.archive_bucket, session.client('backup', config=CONTROLLED_CLIENT_CONFIG), start_datetime, end_datetime, workers, account_id)
+    return fetch_jobs(session.client('backup', config=CONTROLLED_CLIENT_CONFIG), start_datetime, end_datetime, max_workers=workers, account_id=account_id)['backup']
+
+def write_output(args, s3_client, jobs, filename):
+    # Write locally, or to /tmp and upload when --out is an s3:// location
+    if args.out.startswith('s3://'):
+        bucket_name, _, prefix = args.out[len('s3://'):].partition('/')
+        local_path = os.path.join('/tmp', filename)
+    else:
+        bucket_name, prefix = None, ''
+        os.makedirs(args.out, exist_ok=True)
+        local_path = os.path.join(args.out, filename)
+
+    timings = {}
+    stage_start = time.perf_counter()
+    if args.format == 'xlsx':
+        write_to_xlsx(jobs, local_path)
+    else:
+        write_rows(jobs, local_path, REPORT_FIELDNAMES)
+    timings['write'] = time.perf_counter() - stage_start
+
+    if not args.out.startswith('s3://'):
+        return local_path, timings
+    stage_start = time.perf_counter()
+    s3_key = f'{prefix.rstrip("/")}/{filename}' if prefix else filename
+    s3_key = upload_report(s3_client, local_path, bucket_name, s3_key, compression_from_event({'compression': args.compression, 'compression_level': args.compression_level}))
+    timings['upload'] = time.perf_counter() - stage_start
+    return f's3://{bucket_name}/{s3_key}', timings
+
+def run_report(args, clients, account_id, region, start_datetime, end_datetime, workers):
+    # Fetch, write and upload one (account, region, month) report, timing each stage.
+    # clients holds the STS and S3 clients shared by every task.
+    session = account_session(clients['sts'], account_id, args.role_name, region)
+    stage_start = time.perf_counter()
+    jobs = fetch_source(session, clients['s3'], args, account_id, start_datetime, end_datetime, workers)
+    fetch_time = time.perf_counter() - stage_start
+
+    filename = f'backup_jobs_{account_id or "default"}_{region or "default"}_{start_datetime.strftime("%Y-%m-%d")}.{args.format}'
+    location, timings = write_output(args, clients['s3'], jobs, filename)
+    return {'location': location, 'account_id': account_id, 'region': region or '', 'period': start_datetime.strftime('%Y-%m'),
+            **report_metrics(jobs), 'timings': {'fetch': fetch_time, **timings}}
+
+def run(args):
+    start_datetime, end_datetime = resolve_range(args)
+    accounts = [account for account in args.accounts.split(',') if account] or ['']
+    regions = [region for region in args.regions.split(',') if region] or [None]
+    tasks = [
+        (account_id, region, range_start, range_end)
+        for account_id in accounts
+        for region in regions
+        for range_start, range_end in month_ranges(start_datetime, end_datetime)
+    ]
+
+    # Clients on boto3's default session are created here, before the pool starts, since
+    # creating clients on one session from several threads is not thread-safe
+    clients = {'sts': boto3.client('sts'), 's3': boto3.client('s3'), 'sns': boto3.client('sns') if args.notify else None}
+
+    # Run reports in parallel and split the worker budget between them for the window fetches
+    report_workers = max(1, min(args.workers, len(tasks)))
+    fetch_workers = max(1, args.workers // report_workers)
+    run_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=report_workers) as executor:
+        futures = [executor.submit(run_report, args, clients, *task, fetch_workers) for task in tasks]
+        results = [future.result() for future in futures]
+
+    totals = {}
+    for result in results:
+        stage_timings = ' '.join(f'{stage}={seconds:.2f}s' for stage, seconds in result['timings'].items())
+        print(f"{result['location']}: {result['jobs']} jobs ({stage_timings})")
+        for stage, seconds in result['timings'].items():
+            totals[stage] = totals.get(stage, 0) + seconds
+    print(f'{len(results)} reports in {time.perf_counter() - run_start:.2f}s; summed stage times: '
+          + ' '.join(f'{stage}={seconds:.2f}s' for stage, seconds in totals.items()))
+
+    # One digest for the whole run, sent with PublishBatch
+    if args.notify:
+        digest = ReportDigest(clients['sns'], args.notify)
+        for result in results:
+            digest.add(**{key: value for key, value in result.items() if key != 'timings'})
+        digest.publish()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate AWS Backup job reports locally or as a backfill.')
+    parser.add_argument('--from', dest='from_date', help='First day to report on (YYYY-MM-DD)')
+    parser.add_argument('--to', dest='to_date', help='Last day to report on, inclusive (YYYY-MM-DD)')
+    parser.add_argument('--month', help='Month to report on (YYYY-MM, or a month number for the current year)')
+    parser.add_argument('--accounts', default='', help='Comma-separated account IDs; the current credentials are used when omitted')
+    parser.add_argument('--role-name', default='OrganizationAccountAccessRole', help='Role to assume in each account from --accounts')
+    parser.add_argument('--regions', default='', help='Comma-separated regions; the default region is used when omitted')
+    parser.add_argument('--workers', type=int, default=8, help='Total number of parallel API workers')
+    parser.add_argument('--source', choices=['backup', 'cloudtrail', 's3-archive', 'audit-manager', 'history'], default='backup')
+    parser.add_argument('--archive-bucket', default=os.environ.get('S3_BUCKET_NAME'), help='Bucket holding the backup_events/ partitions for --source s3-archive')
+    parser.add_argument('--audit-bucket', default=os.environ.get('AUDIT_REPORT_BUCKET'), help='Bucket receiving Backup Audit Manager report plan deliveries for --source audit-manager')
+    parser.add_argument('--audit-prefix', default=os.environ.get('AUDIT_REPORT_PREFIX', ''), help='Key prefix of the report plan deliveries')
+    parser.add_argument('--audit-report-plan', default=os.environ.get('AUDIT_REPORT_PLAN_NAME'), help='Name of the BACKUP_JOB_REPORT report plan')
+    parser.add_argument('--history-bucket', default=os.environ.get('S3_BUCKET_NAME'), help='Bucket holding previously generated report CSVs for --source history')
+    parser.add_argument('--history-prefix', default='', help='Key prefix of the previously generated reports')
+    parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv')
+    parser.add_argument('--out', default='.', help='Local directory or s3://bucket/prefix')
+    parser.add_argument('--compression', choices=['gzip', 'zstd', 'none'], default='gzip', help='Compression applied when uploading to an s3:// --out')
+    parser.add_argument('--compression-level', type=int, help='Compression level (gzip 1-9, zstd 1-22)')
+    parser.add_argument('--notify', metavar='SNS_TOPIC_ARN', help='Publish a digest of all reports to this topic (skipped by default)')
+    parser.add_argument('--cassette', help='Record AWS responses to, or replay them from, this .jsonl.gz file')
+    parser.add_argument('--cassette-mode', choices=['record', 'replay'], default='replay')
+    parser.add_argument('--replay-latency', choices=['original', 'none'], default='none', help='Sleep for the recorded latency of each call when replaying')
+    args = parser.parse_args(argv)
+
+    if args.source == 's3-archive' and not args.archive_bucket:
+        parser.error('--source s3-archive needs --archive-bucket or S3_BUCKET_NAME')
+    if args.source == 'audit-manager' and not (args.audit_bucket and args.audit_report_plan):
+        parser.error('--source audit-manager needs --audit-bucket and --audit-report-plan')
+
+    if args.cassette:
+        with aws_cassette.use_cassette(args.cassette, args.cassette_mode, args.replay_latency):
+            run(args)
+    else:
+        run(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import os
+import gzip
+import json
+import math
+from datetime import datetime, timedelta
+from event_ingestion import CONDITIONAL_WRITE_ERRORS, error_code
+
+# Per-resource running statistics, kept as one small gzip JSON object:
+# {"resources": {arn: {"last": iso time, "size": [n, mean, m2, ewma], "duration": [...],
+#                      "flags": {iso time: "SIZE_DROP;..."}}}}
+STATE_KEY = 'backup_report/state/resource_stats.json.gz'
+STATE_VERSION = 1
+MAX_UPDATE_ATTEMPTS = 10
+
+Z_THRESHOLD = float(os.environ.get('ANOMALY_Z_THRESHOLD', '3'))
+MIN_SAMPLES = int(os.environ.get('ANOMALY_MIN_SAMPLES', '5'))
+EWMA_ALPHA = float(os.environ.get('ANOMALY_EWMA_ALPHA', '0.2'))
+# Flags are kept long enough to re-annotate every job a 30-day report can contain
+FLAG_RETENTION = timedelta(days=int(os.environ.get('ANOMALY_FLAG_RETENTION_DAYS', '45')))
+# Deviations within this fraction of the mean never count, so near-constant series with a
+# tiny variance do not flag every small change
+RELATIVE_TOLERANCE = 0.1
+GIB = 1024 ** 3
+
+def anomaly_detection_enabled(event):
+    # 'detect_anomalies': true in the event, or ANOMALY_DETECTION=true in the environment;
+    # string values from either are only enabled when they read 'true'
+    value = event.get('detect_anomalies', os.environ.get('ANOMALY_DETECTION', 'false'))
+    if isinstance(value, str):
+        return value.strip().lower() == 'true'
+    return bool(value)
+
+def job_metrics(job):
+    # Backup size in bytes and duration in seconds of a completed job
+    metrics = {'size': float(job.get('BackupSizeInBytes') or 0)}
+    creation_date, completion_date = job.get('CreationDate'), job.get('CompletionDate')
+    if isinstance(creation_date, datetime) and isinstance(completion_date, datetime):
+        metrics['duration'] = (completion_date - creation_date).total_seconds()
+    return metrics
+
+def update_stat(stat, value, alpha=EWMA_ALPHA):
+    # Welford's online mean/variance update plus an exponentially weighted moving average
+    count, mean, m2, ewma = stat or (0, 0.0, 0.0, None)
+    count += 1
+    delta = value - mean
+    mean += delta / count
+    m2 += delta * (value - mean)
+    ewma = value if ewma is None else alpha * value + (1 - alpha) * ewma
+    return [count, mean, m2, ewma]
+
+def deviation(stat, value):
+    # 'JUMP' or 'DROP' when value is more than Z_THRESHOLD standard deviations from the
+    # running mean, once MIN_SAMPLES values have been seen
+    if not stat or stat[0] < MIN_SAMPLES:
+        return None
+    count, mean, m2, _ = stat
+    std = math.sqrt(m2 / (count - 1))
+    if abs(value - mean) <= Z_THRESHOLD * std or abs(value - mean) <= RELATIVE_TOLERANCE * abs(mean):
+        return None
+    return 'JUMP' if value > mean else 'DROP'
+
+def update_statistics(resources, jobs):
+    # Feed the completed jobs newer than each resource's watermark into its statistics,
+    # oldest first, so overlapping report windows never count a job twice. Every job gets
+    # an 'Anomaly' value; returns the anomalies detected in this run.
+    jobs = [job for job in jobs if isinstance(job.get('CreationDate'), datetime)]
+    anomalies = []
+    for job in sorted(jobs, key=lambda job: job['CreationDate']):
+        if job.get('State', '') != 'COMPLETED':
+            continue
+        entry = resources.setdefault(job.get('ResourceArn', ''), {})
+        creation_date = job['CreationDate']
+        if entry.get('last') and creation_date <= datetime.fromisoformat(entry['last']):
+            continue
+        flags = []
+        for metric, value in job_metrics(job).items():
+            direction = deviation(entry.get(metric), value)
+            if direction:
+                flags.append(f'{metric.upper()}_{direction}')
+                anomalies.append({'ResourceArn': job.get('ResourceArn', ''), 'CreationDate': creation_date, 'flag': flags[-1],
+                                  'metric': metric, 'value': value, 'expected': entry[metric][3]})
+            entry[metric] = update_stat(entry.get(metric), value)
+        entry['last'] = creation_date.isoformat()
+        if flags:
+            entry.setdefault('flags', {})[entry['last']] = ';'.join(flags)
+        cutoff = creation_date - FLAG_RETENTION
+        entry['flags'] = {time: flag for time, flag in entry.get('flags', {}).items() if datetime.fromisoformat(time) >= cutoff}
+
+    for job in jobs:
+        flags = resources.get(job.get('ResourceArn', ''), {}).get('flags', {})
+        job['Anomaly'] = flags.get(job['CreationDate'].isoformat(), '')
+    return anomalies
+
+def read_state(s3_client, bucket_name, key=STATE_KEY):
+    # Return the state and its ETag, or an empty state and None if it does not exist yet
+    try:
+        response = s3_client.get_object(Bucket=bucket_name, Key=key)
+    except Exception as e:
+        if error_code(e) in ('NoSuchKey', '404'):
+            return {'version': STATE_VERSION, 'resources': {}}, None
+        raise
+    return json.loads(gzip.decompress(response['Body'].read())), response['ETag']
+
+def update_state(s3_client, bucket_name, jobs, key=STATE_KEY):
+    # Read-update-write the state with an S3 conditional write, as event_ingestion does for
+    # its partitions; on a lost race the update is recomputed from the newer state
+    for _ in range(MAX_UPDATE_ATTEMPTS):
+        state, etag = read_state(s3_client, bucket_name, key)
+        anomalies = update_statistics(state['resources'], jobs)
+        condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+        try:
+            s3_client.put_object(
+                Bucket=bucket_name,
+                Key=key,
+                Body=gzip.compress(json.dumps(state, separators=(',', ':')).encode('utf-8'), mtime=0),
+                ContentType='application/json',
+                ContentEncoding='gzip',
+                **condition
+            )
+            return anomalies
+        except Exception as e:
+            if error_code(e) not in CONDITIONAL_WRITE_ERRORS:
+                raise
+    raise RuntimeError(f'Could not update {key} after {MAX_UPDATE_ATTEMPTS} conditional write attempts')
+
+def format_value(metric, value):
+    return f'{value / GIB:.2f} GiB' if metric == 'size' else f'{value / 60:.1f} min'
+
+def anomaly_section(anomalies, limit=50):
+    # SNS message section listing the new anomalies of this run
+    if not anomalies:
+        return ''
+    lines = [
+        f"{anomaly['ResourceArn']} at {anomaly['CreationDate']:%Y-%m-%d %H:%M}: {anomaly['flag']} "
+        f"({format_value(anomaly['metric'], anomaly['value'])}, typically {format_value(anomaly['metric'], anomaly['expected'])})"
+        for anomaly in anomalies[:limit]
+    ]
+    if len(anomalies) > limit:
+        lines.append(f'... and {len(anomalies) - limit} more (see the Anomaly column)')
+    return f'\n\nBackup size/duration anomalies ({len(anomalies)}):\n' + '\n'.join(lines)
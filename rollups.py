@@ -0,0 +1,122 @@
+import sys
+import json
+import boto3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+# Small aggregate files kept next to the detail reports: one per day, month and year
+ROLLUP_PREFIX = 'backup_report/rollups'
+GIB = 1024 ** 3
+
+def daily_key(day):
+    return f'{ROLLUP_PREFIX}/daily/{day.strftime("%Y/%m/%Y-%m-%d")}.json'
+
+def monthly_key(year, month):
+    return f'{ROLLUP_PREFIX}/monthly/{year}/{year}-{month:02d}.json'
+
+def yearly_key(year):
+    return f'{ROLLUP_PREFIX}/yearly/{year}.json'
+
+def aggregate_jobs(jobs):
+    # Count jobs and bytes per (day, resource type, state)
+    days = {}
+    for job in jobs:
+        creation_date = job.get('CreationDate')
+        if not isinstance(creation_date, datetime):
+            continue
+        groups = days.setdefault(creation_date.date(), {})
+        totals = groups.setdefault((job.get('ResourceType', ''), job.get('State', '')), [0, 0])
+        totals[0] += 1
+        totals[1] += job.get('BackupSizeInBytes') or 0
+    return days
+
+def to_rollup(period, groups):
+    return {
+        'period': period,
+        'groups': [
+            {'resource_type': resource_type, 'state': state, 'jobs': totals[0], 'bytes': totals[1]}
+            for (resource_type, state), totals in sorted(groups.items())
+        ],
+    }
+
+def merge_rollups(period, rollups):
+    # Sum the groups of several rollups into one for a longer period
+    groups = {}
+    for rollup in rollups:
+        for group in rollup['groups']:
+            totals = groups.setdefault((group['resource_type'], group['state']), [0, 0])
+            totals[0] += group['jobs']
+            totals[1] += group['bytes']
+    return to_rollup(period, groups)
+
+def put_rollup(s3_client, bucket_name, key, rollup):
+    s3_client.put_object(Bucket=bucket_name, Key=key, Body=json.dumps(rollup).encode('utf-8'), ContentType='application/json')
+
+def get_rollup(s3_client, bucket_name, key):
+    try:
+        return json.loads(s3_client.get_object(Bucket=bucket_name, Key=key)['Body'].read())
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+            return None
+        raise
+
+def write_daily_rollups(s3_client, bucket_name, jobs, start_datetime, end_datetime):
+    # Only days fully inside the fetched range, and already over, are complete; an empty day
+    # still gets a zero rollup. Current-month reports pass the end of the month, so the
+    # range stops at today's UTC midnight.
+    days = aggregate_jobs(jobs)
+    first_day = (start_datetime + timedelta(days=1) if start_datetime.time() != datetime.min.time() else start_datetime).date()
+    end = min(end_datetime.replace(tzinfo=None), datetime.combine(datetime.utcnow().date(), datetime.min.time()))
+    day = first_day
+    rollups = []
+    while datetime.combine(day + timedelta(days=1), datetime.min.time()) <= end:
+        rollups.append((daily_key(day), to_rollup(day.isoformat(), days.get(day, {}))))
+        day += timedelta(days=1)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda item: put_rollup(s3_client, bucket_name, *item), rollups))
+    return [key for key, _ in rollups]
+
+def write_monthly_rollup(s3_client, bucket_name, year, month):
+    # Merge the month's daily rollups, then refresh the yearly rollup from the monthlies
+    prefix = f'{ROLLUP_PREFIX}/daily/{year}/{month:02d}/'
+    keys = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        keys.extend(item['Key'] for item in page.get('Contents', []))
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        dailies = [rollup for rollup in executor.map(lambda key: get_rollup(s3_client, bucket_name, key), keys) if rollup]
+    put_rollup(s3_client, bucket_name, monthly_key(year, month), merge_rollups(f'{year}-{month:02d}', dailies))
+
+    monthlies = [get_rollup(s3_client, bucket_name, monthly_key(year, m)) for m in range(1, 13)]
+    put_rollup(s3_client, bucket_name, yearly_key(year), merge_rollups(str(year), [rollup for rollup in monthlies if rollup]))
+
+def trend(s3_client, bucket_name, end_year, end_month, months=12):
+    # Success rate and protected GiB per month, read from at most `months` monthly rollups
+    periods = []
+    year, month = end_year, end_month
+    for _ in range(months):
+        periods.append((year, month))
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    with ThreadPoolExecutor(max_workers=months) as executor:
+        rollups = list(executor.map(lambda period: get_rollup(s3_client, bucket_name, monthly_key(*period)), reversed(periods)))
+
+    rows = []
+    for rollup in rollups:
+        if not rollup:
+            continue
+        total_jobs = sum(group['jobs'] for group in rollup['groups'])
+        completed = [group for group in rollup['groups'] if group['state'] == 'COMPLETED']
+        completed_jobs = sum(group['jobs'] for group in completed)
+        rows.append({
+            'month': rollup['period'],
+            'jobs': total_jobs,
+            'success_rate': round(100 * completed_jobs / total_jobs, 2) if total_jobs else 0.0,
+            'protected_gib': round(sum(group['bytes'] for group in completed) / GIB, 2),
+        })
+    return rows
+
+if __name__ == "__main__":
+    # For testing locally: python rollups.py <bucket> <year> <month>
+    bucket_name, end_year, end_month = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+    for row in trend(boto3.client('s3'), bucket_name, end_year, end_month):
+        print(f"{row['month']}: {row['jobs']} jobs, {row['success_rate']}% successful, {row['protected_gib']} GiB protected")
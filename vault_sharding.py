@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from fetch_engine import DEFAULT_MAX_WORKERS, paginate, plan_windows
+from row_serializer import INVENTORY_FIELDNAMES, write_rows
+
+def list_vault_names(backup_client, account_id=''):
+    return [vault['BackupVaultName'] for vault in paginate(backup_client, 'list_backup_vaults', 'BackupVaultList', account_id=account_id)]
+
+def join_recovery_point(job, recovery_points):
+    # Add vault, lifecycle and retention columns from the recovery point index
+    recovery_point = recovery_points.get(job.get('RecoveryPointArn', ''), {})
+    lifecycle = recovery_point.get('Lifecycle', {})
+    job['RecoveryPointStatus'] = recovery_point.get('Status', '')
+    job['MoveToColdStorageAfterDays'] = lifecycle.get('MoveToColdStorageAfterDays', '')
+    job['DeleteAfterDays'] = lifecycle.get('DeleteAfterDays', '')
+    job['DeleteAt'] = recovery_point.get('CalculatedLifecycle', {}).get('DeleteAt', '')
+    return job
+
+def fetch_jobs_by_vault(backup_client, start_datetime, end_datetime, max_workers=DEFAULT_MAX_WORKERS, window=timedelta(days=1), account_id=''):
+    # List the vaults once, then fan out jobs and recovery points per (vault, window) on one pool,
+    # so a vault holding most of the jobs is still split across workers
+    vault_names = list_vault_names(backup_client, account_id)
+    job_windows = plan_windows(start_datetime, end_datetime, window)
+    # Recovery points can be created shortly after the job; look one extra day ahead
+    recovery_point_windows = plan_windows(start_datetime, end_datetime + timedelta(days=1), window)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        recovery_point_futures = [
+            executor.submit(paginate, backup_client, 'list_recovery_points_by_backup_vault', 'RecoveryPoints', account_id=account_id,
+                            BackupVaultName=vault_name, ByCreatedAfter=window_start, ByCreatedBefore=window_end)
+            for vault_name in vault_names
+            for window_start, window_end in recovery_point_windows
+        ]
+        job_futures = [
+            executor.submit(paginate, backup_client, 'list_backup_jobs', 'BackupJobs', account_id=account_id,
+                            ByBackupVaultName=vault_name, ByCreatedAfter=window_start, ByCreatedBefore=window_end)
+            for vault_name in vault_names
+            for window_start, window_end in job_windows
+        ]
+        # In-memory index keyed by recovery point ARN, so the join needs no per-job lookups
+        recovery_points = {
+            recovery_point['RecoveryPointArn']: recovery_point
+            for future in recovery_point_futures
+            for recovery_point in future.result()
+        }
+        jobs = [job for future in job_futures for job in future.result()]
+    return [join_recovery_point(job, recovery_points) for job in jobs]
+
+def write_to_csv_with_inventory(jobs, csv_filename, extra_fieldnames=()):
+    # Write the backup job information plus the recovery point inventory columns to a CSV file
+    return write_rows(jobs, csv_filename, INVENTORY_FIELDNAMES + list(extra_fieldnames))
@@ -1,48 +1,31 @@
 import os
 import boto3
-import csv
 import json
 from datetime import datetime, timedelta
+from audit_manager_source import audit_report_settings, load_jobs_from_audit_reports
+from compression import compression_from_event, upload_report
+from concurrency_controller import CONTROLLED_CLIENT_CONFIG, default_controller
+from external_sort import sort_fields_from_event, sort_jobs
+from fetch_engine import fetch_jobs, requested_job_types, write_section_to_csv
+from idempotent_upload import notify_when_unchanged, upload_if_changed
+from resource_stats import anomaly_detection_enabled, anomaly_section, update_state
+from rollups import write_daily_rollups
+from row_serializer import REPORT_FIELDNAMES, write_rows
+from xlsx_writer import write_to_xlsx
 
-def write_to_csv(jobs, csv_filename):
-    # Write the backup job information to a CSV file
-    with open(csv_filename, 'w', newline='') as csvfile:
-        fieldnames = ['Date', 'Resource Type', 'Resource Name', 'Resource ID', 'Completion Date', 'Backup Start Time', 'Backup End Time', 'State', 'Status Message', 'Message Category', 'Backup Size (GiB)']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        
-        writer.writeheader()
-        for job in jobs:
-            backup_size_gib = job.get('BackupSizeInBytes', 0) / (1024 ** 3)  # Convert bytes to GiB
-            writer.writerow({
-                'Date': job.get('CreationDate', ''),
-                'Completion Date': job.get('CompletionDate', ''),
-                'Backup Start Time': job.get('StartBy', ''),
-                'Backup End Time': job.get('CompletionDate', ''),
-                'State': job.get('State', ''),
-                'Message Category': job.get('MessageCategory', ''),  # Modify as per your requirements
-                'Backup Size (GiB)': round(backup_size_gib, 2),  # Round to two decimal places
-                'Resource ID': job.get('ResourceArn', ''),
-                'Resource Type': job.get('ResourceType', ''),
-                'Resource Name': job.get('ResourceName', ''),
-                'Status Message': job.get('StatusMessage', '')
-            })
+def write_to_csv(jobs, csv_filename, extra_fieldnames=()):
+    # Write the backup job information to a CSV file, plus e.g. the Anomaly column
+    return write_rows(jobs, csv_filename, REPORT_FIELDNAMES + list(extra_fieldnames))
 
 def get_execution_month_year():
     # Get the current execution time and extract month and year
     now = datetime.utcnow()
     return now.year, now.month
 
-def fetch_monthly_backup_jobs(backup_client, start_datetime, end_datetime):
-    # Fetch backup jobs for each day in the specified date range
-    jobs = []
-    while start_datetime <= end_datetime:
-        response = backup_client.list_backup_jobs(
-            ByCreatedBefore=start_datetime + timedelta(days=1),  # Add 1 day to start_datetime to include the entire day
-            ByCreatedAfter=start_datetime
-        )
-        jobs.extend(response.get('BackupJobs', []))
-        start_datetime += timedelta(days=1)
-    return jobs
+def fetch_monthly_backup_jobs(backup_client, start_datetime, end_datetime, job_types=('backup',)):
+    # Fetch jobs for each day in the specified date range, one daily window per worker
+    # Add 1 day to end_datetime to include the entire last day
+    return fetch_jobs(backup_client, start_datetime, end_datetime + timedelta(days=1), job_types)
 
 def lambda_handler(event, context):
     # Retrieve environment variables
@@ -60,7 +43,7 @@ def lambda_handler(event, context):
             input_year = int(input_year)
 
         # Create a Boto3 AWS Backup client using the Lambda execution role's permissions
-        backup_client = boto3.client('backup')
+        backup_client = boto3.client('backup', config=CONTROLLED_CLIENT_CONFIG)
         s3_client = boto3.client('s3')
         sns_client = boto3.client('sns')
 
@@ -68,33 +51,83 @@ def lambda_handler(event, context):
         start_datetime = datetime(input_year, input_month, 1)
         end_datetime = start_datetime.replace(day=1, month=start_datetime.month % 12 + 1) - timedelta(days=1)
 
-        # Fetch all backup jobs for the entire month
-        jobs = fetch_monthly_backup_jobs(backup_client, start_datetime, end_datetime)
+        # Fetch all backup jobs for the entire month, plus copy and restore jobs when requested.
+        # With 'source': 'audit-manager' the jobs are read from Backup Audit Manager report files in S3 instead.
+        if event.get('source') == 'audit-manager':
+            sections = {'backup': load_jobs_from_audit_reports(
+                s3_client,
+                account_id=boto3.client('sts').get_caller_identity()['Account'],
+                region=os.environ['AWS_REGION'],
+                start_datetime=start_datetime,
+                end_datetime=end_datetime + timedelta(days=1),
+                **audit_report_settings()
+            )}
+        else:
+            sections = fetch_monthly_backup_jobs(backup_client, start_datetime, end_datetime, requested_job_types(event))
+        jobs = sections['backup']
+        print(f'API concurrency and throttles: {default_controller.stats()}')
+
+        # Optionally update the per-resource size and duration statistics, which also fills
+        # each job's Anomaly column
+        anomalies = []
+        extra_fieldnames = []
+        if anomaly_detection_enabled(event):
+            anomalies = update_state(s3_client, s3_bucket_name, jobs)
+            extra_fieldnames = ['Anomaly']
 
         # Generate a timestamp for the report
         timestamp = datetime.utcnow().strftime('%Y-%m-%d-%H-%M')
 
-        # Write the output to a CSV file with a timestamp
-        csv_filename = f'/tmp/backup_jobs_{timestamp}.csv'
-        write_to_csv(jobs, csv_filename)
+        # Write the output to a CSV file (or an XLSX workbook when requested) with a timestamp
+        report_format = event.get('format', 'csv')
+        # Reports are gzip-compressed on upload unless 'compression' says otherwise ('zstd' or 'none')
+        compression = compression_from_event(event)
+        csv_filename = f'/tmp/backup_jobs_{timestamp}.{report_format}'
+        # Optionally sort the rows (e.g. 'sort_by': 'CreationDate,ResourceArn'); the jobs are
+        # already in memory for the rollups, so they are sorted in memory
+        sort_fields = sort_fields_from_event(event)
+        report_jobs = sort_jobs(jobs, sort_fields) if sort_fields else jobs
+        content_hash = None
+        if report_format == 'xlsx':
+            write_to_xlsx(report_jobs, csv_filename)
+        else:
+            content_hash = write_to_csv(report_jobs, csv_filename, extra_fieldnames)
 
         # Generate folder name with year-month-date
         folder_name = end_datetime.strftime('%Y-%m-%d')
 
-        # Upload the CSV file to the specified folder in the S3 bucket
-        s3_key = f'backup_report/{folder_name}/backup_jobs_{timestamp}.csv'
-        s3_client.upload_file(csv_filename, s3_bucket_name, s3_key)
+        # Upload the report file to the specified folder in the S3 bucket
+        # unless the last uploaded report for the month has the same content
+        s3_key = f'backup_report/{folder_name}/backup_jobs_{timestamp}.{report_format}'
+        uploaded, s3_key = upload_if_changed(s3_client, csv_filename, s3_bucket_name, s3_key, content_hash, marker_key=f'backup_report/{folder_name}/latest_backup_jobs.{report_format}.marker', compression=compression)
+        report_locations = [f's3://{s3_bucket_name}/{s3_key}']
+
+        # Write the per-day aggregate rollups next to the detail report
+        if uploaded:
+            write_daily_rollups(s3_client, s3_bucket_name, jobs, start_datetime, end_datetime + timedelta(days=1))
+
+        # Write and upload the copy and restore job sections, if requested
+        for job_type, section_jobs in sections.items():
+            if job_type == 'backup':
+                continue
+            section_filename = f'/tmp/{job_type}_jobs_{timestamp}.csv'
+            write_section_to_csv(job_type, section_jobs, section_filename)
+            section_key = f'backup_report/{folder_name}/{job_type}_jobs_{timestamp}.csv'
+            section_key = upload_report(s3_client, section_filename, s3_bucket_name, section_key, compression)
+            report_locations.append(f's3://{s3_bucket_name}/{section_key}')
 
         # Send SNS notification with the timestamped S3 key
-        sns_client.publish(
-            TopicArn=sns_topic_arn,
-            Subject='AWS Backup Job Report',
-            Message=f'The AWS Backup job report for {end_datetime.strftime("%B %Y")} is available at: s3://{s3_bucket_name}/{s3_key}'
-        )
+        if uploaded or notify_when_unchanged():
+            sns_client.publish(
+                TopicArn=sns_topic_arn,
+                Subject='AWS Backup Job Report',
+                Message=f'The AWS Backup job report for {end_datetime.strftime("%B %Y")} is available at: ' + ', '.join(report_locations) + anomaly_section(anomalies)
+            )
 
         return {
             'statusCode': 200,
-            'body': json.dumps('CSV file generated and SNS notification sent successfully!')
+            'body': json.dumps('CSV file generated and SNS notification sent successfully!' if uploaded else 'Report unchanged since the last run; upload skipped.'),
+            'noop': not uploaded
         }
     except Exception as e:
         return {
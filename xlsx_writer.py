@@ -0,0 +1,86 @@
+from datetime import datetime, timezone
+
+try:
+    import xlsxwriter
+except ImportError:  # Optional dependency, only needed for the xlsx output format
+    xlsxwriter = None
+
+DETAIL_FIELDNAMES = ['Date', 'Resource Type', 'Resource Name', 'Resource ID', 'Completion Date', 'Backup Start Time', 'Backup End Time', 'State', 'Status Message', 'Message Category', 'Backup Size (GiB)']
+SUMMARY_FIELDNAMES = ['Month', 'Resource Type', 'State', 'Jobs', 'Backup Size (GiB)']
+DATE_COLUMNS = {0, 4, 5, 6}
+GIB = 1024 ** 3
+# xlsxwriter ignores writes past the last worksheet row instead of raising
+MAX_SHEET_ROWS = 1048576
+
+def to_excel_datetime(value):
+    # Excel has no time zones; store every timestamp as naive UTC
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+    return None
+
+def write_to_xlsx(jobs, xlsx_filename, tmpdir='/tmp'):
+    # Stream backup jobs into a workbook with a summary sheet and one detail sheet per month.
+    # constant_memory flushes each row to a temp file as soon as the next row starts,
+    # so memory stays flat regardless of how many jobs the month holds.
+    if xlsxwriter is None:
+        raise RuntimeError('The xlsx output format requires the xlsxwriter package.')
+
+    workbook = xlsxwriter.Workbook(xlsx_filename, {'constant_memory': True, 'tmpdir': tmpdir})
+    header_format = workbook.add_format({'bold': True})
+    date_format = workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
+    size_format = workbook.add_format({'num_format': '0.00'})
+
+    # Add the summary sheet first so it is the first tab; its rows are written at the end
+    summary_sheet = workbook.add_worksheet('Summary')
+    detail_sheets = {}
+    summary = {}
+
+    for job in jobs:
+        creation_date = to_excel_datetime(job.get('CreationDate'))
+        month = creation_date.strftime('%Y-%m') if creation_date else 'Unknown'
+        if month not in detail_sheets or detail_sheets[month][1] == MAX_SHEET_ROWS:
+            # A month that fills its sheet continues in '<month> (2)', '<month> (3)', ...
+            part = detail_sheets[month][2] + 1 if month in detail_sheets else 1
+            sheet = workbook.add_worksheet(month if part == 1 else f'{month} ({part})')
+            sheet.write_row(0, 0, DETAIL_FIELDNAMES, header_format)
+            detail_sheets[month] = [sheet, 1, part]
+        sheet, row, _ = detail_sheets[month]
+
+        backup_size_bytes = job.get('BackupSizeInBytes') or 0
+        backup_size_gib = backup_size_bytes / GIB
+        values = [
+            job.get('CreationDate', ''),
+            job.get('ResourceType', ''),
+            job.get('ResourceName', ''),
+            job.get('ResourceArn', ''),
+            job.get('CompletionDate', ''),
+            job.get('StartBy', ''),
+            job.get('CompletionDate', ''),
+            job.get('State', ''),
+            job.get('StatusMessage', ''),
+            job.get('MessageCategory', ''),
+        ]
+        for column, value in enumerate(values):
+            excel_datetime = to_excel_datetime(value) if column in DATE_COLUMNS else None
+            if excel_datetime is not None:
+                sheet.write_datetime(row, column, excel_datetime, date_format)
+            elif value not in ('', None):
+                sheet.write_string(row, column, str(value))
+        sheet.write_number(row, len(values), backup_size_gib, size_format)
+        detail_sheets[month][1] = row + 1
+
+        # Pre-aggregate the summary while the rows stream past
+        key = (month, job.get('ResourceType', ''), job.get('State', ''))
+        totals = summary.setdefault(key, [0, 0])
+        totals[0] += 1
+        totals[1] += backup_size_bytes
+
+    summary_sheet.write_row(0, 0, SUMMARY_FIELDNAMES, header_format)
+    for row, (key, totals) in enumerate(sorted(summary.items()), start=1):
+        summary_sheet.write_row(row, 0, key)
+        summary_sheet.write_number(row, 3, totals[0])
+        summary_sheet.write_number(row, 4, totals[1] / GIB, size_format)
+
+    workbook.close()